@@ -0,0 +1,241 @@
+"""Single-pass aggregation layer behind the charts and insights.json.
+
+All transactions are reduced in one vectorized groupby to a compact base cube
+keyed by day x category x hour holding the sum and count of ``amount`` and a
+histogram of transaction sizes (one count column per size bucket). Every
+chart and insights section is then a cheap rollup of that cube (a few
+thousand rows) instead of another scan over the transactions.
+
+Order statistics (median, percentiles, largest transactions) cannot be
+recovered from sums and counts, so they are taken from the amount column in
+the same pass and kept alongside the cube.
+
+Aggregates are mergeable, which gives a streaming mode for ledgers larger
+than memory: :func:`stream` reads the CSV in bounded chunks, builds partial
+aggregates per chunk and folds them together. Percentiles then come from a
+:class:`~sketches.QuantileSketch` instead of the full amount column.
+"""
+import numpy as np
+import pandas as pd
+
+import fx
+import ledger_cache
+from ledger_cache import MINOR_UNITS
+from sketches import QuantileSketch
+
+DAY_ORDER = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+PERCENTILES = [10, 25, 50, 75, 90, 95, 99]
+
+# Transaction size histogram, right-closed like pd.cut: (0, 5], (5, 10], ...
+# with everything above the last edge in the final bucket.
+SIZE_EDGES = [0, 5, 10, 20, 50, 100, 200, 500]
+_SIZE_EDGES_MINOR = np.array(SIZE_EDGES, dtype=np.int64) * MINOR_UNITS
+SIZE_LABELS = ['<₼5', '₼5-10', '₼10-20', '₼20-50', '₼50-100', '₼100-200', '₼200-500', '>₼500']
+TOP_N = 15
+CHUNKSIZE = 1_000_000
+
+CUBE_KEYS = ['day', 'category', 'hour']
+# Per-cell transaction counts by size bucket (1-based, see size_bucket)
+SIZE_COLUMNS = [f'size_{i}' for i in range(1, len(SIZE_LABELS) + 1)]
+CUBE_VALUES = ['sum', 'count'] + SIZE_COLUMNS
+
+# Dimensions that can be derived from the cube's ``day`` level.
+_DAY_DERIVED = {
+    'year': lambda day: day.dt.year,
+    'month': lambda day: day.dt.month,
+    'year_month': lambda day: day.dt.to_period('M'),
+    'quarter': lambda day: day.dt.to_period('Q'),
+    'day_of_week': lambda day: day.dt.day_name(),
+}
+
+
+def size_bucket(amount_minor):
+    """Return the 1-based size bucket of each amount in qəpik (0 for <= 0)."""
+    return np.searchsorted(_SIZE_EDGES_MINOR, amount_minor, side='left').astype(np.int8)
+
+
+class Aggregates:
+    """Base cube plus the order statistics needed by the report.
+
+    Percentiles are exact when built from a whole frame and approximate
+    (see :mod:`sketches`) when ``sketch`` is set.
+    """
+
+    def __init__(self, cube, top, date_min, date_max, size_counts,
+                 percentiles=None, sketch=None):
+        self.cube = cube
+        self.top = top
+        self.date_min = date_min
+        self.date_max = date_max
+        self.size_counts = size_counts
+        self._percentiles = percentiles
+        self.sketch = sketch
+
+    @property
+    def total(self):
+        return float(self.cube['sum'].sum())
+
+    @property
+    def count(self):
+        return int(self.cube['count'].sum())
+
+    @property
+    def percentiles(self):
+        if self._percentiles is None:
+            self._percentiles = self.sketch.percentiles(PERCENTILES)
+        return self._percentiles
+
+    @property
+    def median(self):
+        return self.percentiles[50]
+
+    def size_share(self, name):
+        """Share (in %) of ``small`` (< 10), ``medium`` or ``large`` (> 50) transactions."""
+        count = self.count
+        return self.size_counts[name] / count * 100 if count else np.nan
+
+    def size_histogram(self):
+        """Number of transactions in each size bucket (indexed 1..n)."""
+        counts = self.cube[SIZE_COLUMNS].sum().to_numpy()
+        return pd.Series(counts, index=pd.Index(range(1, len(SIZE_COLUMNS) + 1),
+                                                name='size_bucket'), name='count')
+
+    def rollup(self, by):
+        """Roll the cube up to ``by`` and return sum, count and mean per group."""
+        by = [by] if isinstance(by, str) else list(by)
+        cube = self.cube
+        derived = {key: _DAY_DERIVED[key](cube['day']) for key in by if key in _DAY_DERIVED}
+        if derived:
+            cube = cube.assign(**derived)
+        result = cube.groupby(by, observed=True)[['sum', 'count']].sum()
+        result['mean'] = result['sum'] / result['count']
+        return result
+
+    def merge(self, other, amount_minor=None):
+        """Combine with the aggregates of a disjoint set of transactions.
+
+        Sketch-based aggregates merge their sketches; exact ones need
+        ``amount_minor``, the amounts of both sets, to recompute percentiles.
+        """
+        exact = self.sketch is None or other.sketch is None
+        if exact and amount_minor is None:
+            raise ValueError('exact aggregates need the combined amounts to be merged')
+        cubes = [self.cube, other.cube]
+        if all(isinstance(c['category'].dtype, pd.CategoricalDtype) for c in cubes):
+            # Concatenating different code tables would fall back to strings
+            table = cubes[0]['category'].cat.categories.union(
+                cubes[1]['category'].cat.categories, sort=False)
+            cubes = [c.assign(category=c['category'].cat.set_categories(table)) for c in cubes]
+        cube = pd.concat(cubes, ignore_index=True)
+        cube = cube.groupby(CUBE_KEYS, observed=True, sort=False)[CUBE_VALUES].sum()
+        top = pd.concat([self.top, other.top]).nlargest(TOP_N, 'amount')
+        sketch = None
+        if not exact:
+            # QuantileSketch.merge folds in place; leave both inputs untouched
+            sketch = QuantileSketch(self.sketch.alpha, self.sketch.max_buckets)
+            sketch.merge(self.sketch).merge(other.sketch)
+        return Aggregates(
+            cube=cube.reset_index(),
+            top=top,
+            date_min=min(self.date_min, other.date_min),
+            date_max=max(self.date_max, other.date_max),
+            size_counts={k: self.size_counts[k] + other.size_counts[k] for k in self.size_counts},
+            percentiles=_percentiles(np.asarray(amount_minor)) if exact else None,
+            sketch=sketch,
+        )
+
+    def restrict(self, cube_mask, df):
+        """Aggregates of a subset of the transactions, without a regroup.
+
+        ``cube_mask`` selects the subset's cells of the cube and ``df`` holds
+        its transactions, from which only the order statistics are taken.
+        """
+        return Aggregates(cube=self.cube[cube_mask], **_order_stats(df, self.sketch is not None))
+
+
+def _percentiles(amount):
+    if not len(amount):
+        return dict.fromkeys(PERCENTILES, np.nan)
+    values = np.percentile(amount, PERCENTILES) / MINOR_UNITS
+    return dict(zip(PERCENTILES, values.tolist()))
+
+
+def _order_stats(df, sketch=False):
+    """Everything :class:`Aggregates` holds besides the cube."""
+    amount = df['amount_minor'].to_numpy()
+    top = df.nlargest(TOP_N, 'amount_minor')
+    return {
+        'top': pd.DataFrame({
+            'date': top['date'],
+            'category': top['category'],
+            'amount': top['amount_minor'] / MINOR_UNITS,
+        }),
+        'date_min': df['date'].min(),
+        'date_max': df['date'].max(),
+        'size_counts': {
+            'small': int(np.count_nonzero(amount < 10 * MINOR_UNITS)),
+            'medium': int(np.count_nonzero((amount >= 10 * MINOR_UNITS)
+                                           & (amount <= 50 * MINOR_UNITS))),
+            'large': int(np.count_nonzero(amount > 50 * MINOR_UNITS)),
+        },
+        'percentiles': None if sketch else _percentiles(amount),
+        'sketch': QuantileSketch().add(amount / MINOR_UNITS) if sketch else None,
+    }
+
+
+def build(df, sketch=False):
+    """Reduce a typed ledger (see :mod:`ledger_cache`) to :class:`Aggregates`.
+
+    One vectorized groupby over small-integer keys builds the cube; sums are
+    accumulated exactly in qəpik and converted to manat afterwards. With
+    ``sketch`` the percentiles come from a :class:`QuantileSketch` so the
+    result can be merged with other partial aggregates.
+    """
+    amount = df['amount_minor'].to_numpy()
+    keys = pd.DataFrame({
+        'day': df['day'],
+        'category': df['category'],
+        'hour': df['hour'],
+        'amount': amount,
+    })
+    grouped = keys.groupby(CUBE_KEYS, observed=True, sort=False)
+    cube = grouped['amount'].agg(['sum', 'count']).reset_index()
+    # Size histogram per cell: one bincount over (cell, bucket) pairs;
+    # bucket 0 (amounts <= 0) is dropped.
+    width = len(SIZE_COLUMNS) + 1
+    cells = grouped.ngroup().to_numpy()
+    hist = np.bincount(cells * width + size_bucket(amount),
+                       minlength=len(cube) * width).reshape(len(cube), width)
+    cube[SIZE_COLUMNS] = hist[:, 1:]
+    cube['day'] = pd.to_datetime(cube['day'], unit='D')
+    cube['sum'] = cube['sum'] / MINOR_UNITS
+
+    return Aggregates(cube=cube, **_order_stats(df, sketch))
+
+
+def merge_all(partials):
+    """Fold an iterable of sketch-based aggregates into one."""
+    result = None
+    for partial in partials:
+        result = partial if result is None else result.merge(partial)
+    return result
+
+
+def stream(csv_path, chunksize=CHUNKSIZE, rates=None):
+    """Aggregate a CSV ledger chunk by chunk in bounded memory.
+
+    Only one chunk of transactions is held at a time; what persists between
+    chunks is the cube (bounded by days x categories x hours, not by the
+    number of rows), the running top transactions and the
+    quantile sketch. ``rates`` (an :class:`fx.RateTable`) converts chunks
+    with a ``currency`` column.
+    """
+    def partials():
+        categories = []
+        reader = pd.read_csv(csv_path, dtype=ledger_cache.RAW_DTYPES, chunksize=chunksize)
+        for raw in reader:
+            chunk = ledger_cache.parse_frame(raw, categories)
+            categories = list(chunk['category'].cat.categories)
+            yield build(fx.normalize(chunk, rates), sketch=True)
+
+    return merge_all(partials())
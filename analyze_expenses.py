@@ -1,469 +1,401 @@
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-from datetime import datetime
-import numpy as np
-
-# Set style
-sns.set_style("whitegrid")
-plt.rcParams['figure.figsize'] = (12, 6)
-plt.rcParams['font.size'] = 10
-
-# Read data
-df = pd.read_csv('budget.csv')
-df['date'] = pd.to_datetime(df['date'])
-df['year'] = df['date'].dt.year
-df['month'] = df['date'].dt.month
-df['year_month'] = df['date'].dt.to_period('M')
-df['day_of_week'] = df['date'].dt.day_name()
-df['hour'] = df['date'].dt.hour
-
-# Print basic statistics
-print("=" * 60)
-print("EXPENSE DATA ANALYSIS")
-print("=" * 60)
-print(f"\nTotal Transactions: {len(df):,}")
-print(f"Date Range: {df['date'].min().date()} to {df['date'].max().date()}")
-print(f"Total Spent: ₼{df['amount'].sum():,.2f}")
-print(f"Average Transaction: ₼{df['amount'].mean():.2f}")
-print(f"Median Transaction: ₼{df['amount'].median():.2f}")
-
-# Category breakdown
-print("\n" + "=" * 60)
-print("SPENDING BY CATEGORY")
-print("=" * 60)
-category_stats = df.groupby('category').agg({
-    'amount': ['sum', 'count', 'mean']
-}).round(2)
-category_stats.columns = ['Total', 'Count', 'Avg']
-category_stats = category_stats.sort_values('Total', ascending=False)
-print(category_stats)
-
-# Monthly statistics
-monthly_stats = df.groupby('year_month')['amount'].agg(['sum', 'count', 'mean']).round(2)
-monthly_stats.columns = ['Total', 'Transactions', 'Average']
-
-print("\n" + "=" * 60)
-print("MONTHLY SPENDING TRENDS")
-print("=" * 60)
-print(f"Average Monthly Spending: ₼{monthly_stats['Total'].mean():,.2f}")
-print(f"Highest Month: {monthly_stats['Total'].idxmax()} (₼{monthly_stats['Total'].max():,.2f})")
-print(f"Lowest Month: {monthly_stats['Total'].idxmin()} (₼{monthly_stats['Total'].min():,.2f})")
-
-# Chart 1: Total Spending by Category (Pie Chart)
-plt.figure(figsize=(14, 10))
-category_totals = df.groupby('category')['amount'].sum().sort_values(ascending=False)
-
-# Group smaller categories (less than 2% of total) into "Other"
-total_amount = category_totals.sum()
-threshold = total_amount * 0.02  # 2% threshold
-major_categories = category_totals[category_totals >= threshold]
-other_sum = category_totals[category_totals < threshold].sum()
-
-if other_sum > 0:
-    major_categories['Other (Combined)'] = other_sum
-
-colors = sns.color_palette("husl", len(major_categories))
-
-# Create pie chart with legend instead of labels
-wedges, texts, autotexts = plt.pie(major_categories, autopct='%1.1f%%',
-                                     startangle=90, colors=colors,
-                                     pctdistance=0.85, textprops={'fontsize': 11, 'fontweight': 'bold'})
-
-# Create legend with category names and amounts
-legend_labels = [f'{cat}: ₼{val:,.0f}' for cat, val in major_categories.items()]
-plt.legend(legend_labels, loc='center left', bbox_to_anchor=(1, 0, 0.5, 1),
-          fontsize=11, frameon=True, fancybox=True, shadow=True)
-
-plt.title('Spending Distribution by Category', fontsize=16, fontweight='bold', pad=20)
-plt.tight_layout()
-plt.savefig('charts/spending_by_category.png', dpi=300, bbox_inches='tight')
-plt.close()
-
-# Chart 2: Monthly Spending Trend
-plt.figure(figsize=(14, 6))
-monthly_totals = df.groupby('year_month')['amount'].sum()
-plt.plot(monthly_totals.index.astype(str), monthly_totals.values,
-         marker='o', linewidth=2, markersize=6, color='#2E86AB')
-plt.axhline(y=monthly_totals.mean(), color='r', linestyle='--',
-            label=f'Average: ₼{monthly_totals.mean():.2f}', linewidth=2)
-plt.fill_between(range(len(monthly_totals)), monthly_totals.values,
-                 alpha=0.3, color='#2E86AB')
-plt.xlabel('Month', fontsize=12, fontweight='bold')
-plt.ylabel('Total Spending (₼)', fontsize=12, fontweight='bold')
-plt.title('Monthly Spending Trend', fontsize=16, fontweight='bold', pad=20)
-plt.xticks(rotation=45, ha='right')
-plt.legend(fontsize=11)
-plt.grid(True, alpha=0.3)
-plt.tight_layout()
-plt.savefig('charts/monthly_trend.png', dpi=300, bbox_inches='tight')
-plt.close()
-
-# Chart 3: Category Spending Over Time (Stacked Area)
-plt.figure(figsize=(14, 7))
-category_monthly = df.groupby(['year_month', 'category'])['amount'].sum().unstack(fill_value=0)
-category_monthly.plot(kind='area', stacked=True, alpha=0.7,
-                     colormap='tab10', ax=plt.gca())
-plt.xlabel('Month', fontsize=12, fontweight='bold')
-plt.ylabel('Spending (₼)', fontsize=12, fontweight='bold')
-plt.title('Category Spending Trends Over Time', fontsize=16, fontweight='bold', pad=20)
-plt.legend(title='Category', bbox_to_anchor=(1.05, 1), loc='upper left')
-plt.xticks(rotation=45, ha='right')
-plt.grid(True, alpha=0.3)
-plt.tight_layout()
-plt.savefig('charts/category_trends.png', dpi=300, bbox_inches='tight')
-plt.close()
-
-# Chart 4: Average Daily Spending by Day of Week
-plt.figure(figsize=(12, 6))
-day_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-daily_spending = df.groupby('day_of_week')['amount'].agg(['sum', 'count', 'mean'])
-daily_spending = daily_spending.reindex(day_order)
-colors_week = ['#FF6B6B' if day in ['Saturday', 'Sunday'] else '#4ECDC4'
-               for day in day_order]
-bars = plt.bar(range(len(day_order)), daily_spending['mean'], color=colors_week,
-               edgecolor='black', linewidth=1.2)
-plt.xlabel('Day of Week', fontsize=12, fontweight='bold')
-plt.ylabel('Average Spending per Transaction (₼)', fontsize=12, fontweight='bold')
-plt.title('Average Spending by Day of Week', fontsize=16, fontweight='bold', pad=20)
-plt.xticks(range(len(day_order)), day_order, rotation=45, ha='right')
-plt.grid(axis='y', alpha=0.3)
-plt.tight_layout()
-plt.savefig('charts/spending_by_day.png', dpi=300, bbox_inches='tight')
-plt.close()
-
-# Chart 5: Top Categories Bar Chart
-plt.figure(figsize=(12, 7))
-top_categories = df.groupby('category')['amount'].sum().sort_values(ascending=True)
-colors_bar = sns.color_palette("RdYlGn_r", len(top_categories))
-bars = plt.barh(range(len(top_categories)), top_categories.values, color=colors_bar,
-                edgecolor='black', linewidth=1.2)
-plt.yticks(range(len(top_categories)), top_categories.index, fontsize=11)
-plt.xlabel('Total Spending (₼)', fontsize=12, fontweight='bold')
-plt.title('Total Spending by Category', fontsize=16, fontweight='bold', pad=20)
-plt.grid(axis='x', alpha=0.3)
-
-# Add value labels
-for i, (idx, val) in enumerate(top_categories.items()):
-    plt.text(val, i, f' ₼{val:,.0f}', va='center', fontsize=10, fontweight='bold')
-
-plt.tight_layout()
-plt.savefig('charts/category_totals.png', dpi=300, bbox_inches='tight')
-plt.close()
-
-# Chart 6: Spending Heatmap by Hour and Day
-plt.figure(figsize=(14, 8))
-hourly_daily = df.groupby(['day_of_week', 'hour'])['amount'].sum().unstack(fill_value=0)
-hourly_daily = hourly_daily.reindex(day_order)
-sns.heatmap(hourly_daily, cmap='YlOrRd', annot=False, fmt='.0f',
-            cbar_kws={'label': 'Total Spending (₼)'})
-plt.xlabel('Hour of Day', fontsize=12, fontweight='bold')
-plt.ylabel('Day of Week', fontsize=12, fontweight='bold')
-plt.title('Spending Patterns by Day and Hour', fontsize=16, fontweight='bold', pad=20)
-plt.tight_layout()
-plt.savefig('charts/spending_heatmap.png', dpi=300, bbox_inches='tight')
-plt.close()
-
-# Chart 7: Transaction Count vs Amount by Category
-fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(16, 6))
-
-# Transaction count
-category_counts = df['category'].value_counts().sort_values(ascending=True)
-colors_count = sns.color_palette("viridis", len(category_counts))
-ax1.barh(range(len(category_counts)), category_counts.values,
-         color=colors_count, edgecolor='black', linewidth=1.2)
-ax1.set_yticks(range(len(category_counts)))
-ax1.set_yticklabels(category_counts.index)
-ax1.set_xlabel('Number of Transactions', fontsize=12, fontweight='bold')
-ax1.set_title('Transaction Frequency by Category', fontsize=14, fontweight='bold')
-ax1.grid(axis='x', alpha=0.3)
-
-# Average amount
-category_avg = df.groupby('category')['amount'].mean().sort_values(ascending=True)
-colors_avg = sns.color_palette("plasma", len(category_avg))
-ax2.barh(range(len(category_avg)), category_avg.values,
-         color=colors_avg, edgecolor='black', linewidth=1.2)
-ax2.set_yticks(range(len(category_avg)))
-ax2.set_yticklabels(category_avg.index)
-ax2.set_xlabel('Average Transaction Amount (₼)', fontsize=12, fontweight='bold')
-ax2.set_title('Average Spending per Transaction', fontsize=14, fontweight='bold')
-ax2.grid(axis='x', alpha=0.3)
-
-plt.tight_layout()
-plt.savefig('charts/transaction_analysis.png', dpi=300, bbox_inches='tight')
-plt.close()
-
-# Chart 8: Spending Percentile Distribution
-plt.figure(figsize=(12, 6))
-percentiles = [10, 25, 50, 75, 90, 95, 99]
-percentile_values = [np.percentile(df['amount'], p) for p in percentiles]
-
-bars = plt.bar([f'{p}th' for p in percentiles], percentile_values,
-               color=sns.color_palette("coolwarm", len(percentiles)),
-               edgecolor='black', linewidth=1.2)
-plt.ylabel('Transaction Amount (₼)', fontsize=12, fontweight='bold')
-plt.xlabel('Percentile', fontsize=12, fontweight='bold')
-plt.title('Spending Distribution by Percentile', fontsize=16, fontweight='bold', pad=20)
-plt.grid(axis='y', alpha=0.3)
-
-# Add value labels
-for i, (p, val) in enumerate(zip(percentiles, percentile_values)):
-    plt.text(i, val, f'₼{val:.2f}', ha='center', va='bottom',
-             fontsize=10, fontweight='bold')
-
-plt.tight_layout()
-plt.savefig('charts/spending_percentiles.png', dpi=300, bbox_inches='tight')
-plt.close()
-
-# Chart 9: Year-over-Year Comparison
-if len(df['year'].unique()) > 1:
-    plt.figure(figsize=(14, 7))
-    yearly_data = df.groupby(['year', 'month'])['amount'].sum().unstack(fill_value=0)
-
-    for year in yearly_data.index:
-        plt.plot(range(1, 13), yearly_data.loc[year], marker='o', linewidth=2.5,
-                markersize=8, label=str(year), alpha=0.8)
-
-    plt.xlabel('Month', fontsize=12, fontweight='bold')
-    plt.ylabel('Total Spending (₼)', fontsize=12, fontweight='bold')
-    plt.title('Year-over-Year Monthly Spending Comparison', fontsize=16, fontweight='bold', pad=20)
-    plt.xticks(range(1, 13), ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
-                               'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'])
-    plt.legend(title='Year', fontsize=11, loc='best')
-    plt.grid(True, alpha=0.3)
-    plt.tight_layout()
-    plt.savefig('charts/year_over_year.png', dpi=300, bbox_inches='tight')
-    plt.close()
-
-# Chart 10: Quarterly Spending Trends
-plt.figure(figsize=(12, 6))
-df['quarter'] = df['date'].dt.to_period('Q')
-quarterly_data = df.groupby('quarter')['amount'].sum()
-quarters_str = [str(q) for q in quarterly_data.index]
-
-bars = plt.bar(range(len(quarterly_data)), quarterly_data.values,
-               color=sns.color_palette("viridis", len(quarterly_data)),
-               edgecolor='black', linewidth=1.2)
-plt.xlabel('Quarter', fontsize=12, fontweight='bold')
-plt.ylabel('Total Spending (₼)', fontsize=12, fontweight='bold')
-plt.title('Quarterly Spending Trends', fontsize=16, fontweight='bold', pad=20)
-plt.xticks(range(len(quarters_str)), quarters_str, rotation=45, ha='right')
-plt.grid(axis='y', alpha=0.3)
-
-# Add value labels
-for i, val in enumerate(quarterly_data.values):
-    plt.text(i, val, f'₼{val:,.0f}', ha='center', va='bottom',
-             fontsize=9, fontweight='bold')
-
-plt.tight_layout()
-plt.savefig('charts/quarterly_trends.png', dpi=300, bbox_inches='tight')
-plt.close()
-
-# Chart 11: Top 15 Most Expensive Transactions
-plt.figure(figsize=(12, 8))
-top_transactions = df.nlargest(15, 'amount')[['date', 'category', 'amount']].reset_index(drop=True)
-colors_top = sns.color_palette("Reds_r", len(top_transactions))
-
-bars = plt.barh(range(len(top_transactions)), top_transactions['amount'],
-                color=colors_top, edgecolor='black', linewidth=1.2)
-labels = [f"{row['category']} ({row['date'].strftime('%Y-%m-%d')})"
-          for _, row in top_transactions.iterrows()]
-plt.yticks(range(len(top_transactions)), labels, fontsize=10)
-plt.xlabel('Transaction Amount (₼)', fontsize=12, fontweight='bold')
-plt.title('Top 15 Most Expensive Transactions', fontsize=16, fontweight='bold', pad=20)
-plt.grid(axis='x', alpha=0.3)
-
-# Add value labels
-for i, val in enumerate(top_transactions['amount']):
-    plt.text(val, i, f' ₼{val:.2f}', va='center', fontsize=9, fontweight='bold')
-
-plt.tight_layout()
-plt.savefig('charts/top_transactions.png', dpi=300, bbox_inches='tight')
-plt.close()
-
-# Chart 12: Category Spending as Percentage (Donut Chart)
-plt.figure(figsize=(14, 10))
-
-# Use major categories only (>2% threshold)
-category_pct = (major_categories / major_categories.sum()) * 100
-colors_donut = sns.color_palette("Set3", len(category_pct))
-
-# Create donut chart with percentages only
-wedges, texts, autotexts = plt.pie(category_pct, autopct='%1.1f%%',
-                                     startangle=90, colors=colors_donut,
-                                     pctdistance=0.80, textprops={'fontsize': 11, 'fontweight': 'bold'})
-
-# Draw circle for donut
-centre_circle = plt.Circle((0, 0), 0.65, fc='white')
-fig = plt.gcf()
-fig.gca().add_artist(centre_circle)
-
-# Add total in center
-plt.text(0, 0, f'Total Spent:\n₼{category_totals.sum():,.0f}',
-         ha='center', va='center', fontsize=18, fontweight='bold')
-
-# Create legend with category names
-legend_labels = [f'{cat}' for cat in major_categories.index]
-plt.legend(legend_labels, loc='center left', bbox_to_anchor=(1, 0, 0.5, 1),
-          fontsize=11, frameon=True, fancybox=True, shadow=True)
-
-plt.title('Category Distribution (% of Total Spending)', fontsize=16,
-          fontweight='bold', pad=20)
-plt.tight_layout()
-plt.savefig('charts/category_percentage.png', dpi=300, bbox_inches='tight')
-plt.close()
-
-# Chart 13: Monthly Growth Rate
-plt.figure(figsize=(14, 6))
-monthly_growth = monthly_totals.pct_change() * 100
-colors_growth = ['green' if x > 0 else 'red' for x in monthly_growth]
-
-plt.bar(range(len(monthly_growth)), monthly_growth.values, color=colors_growth,
-        edgecolor='black', linewidth=1.2, alpha=0.7)
-plt.axhline(y=0, color='black', linestyle='-', linewidth=1.5)
-plt.xlabel('Month', fontsize=12, fontweight='bold')
-plt.ylabel('Growth Rate (%)', fontsize=12, fontweight='bold')
-plt.title('Month-over-Month Spending Growth Rate', fontsize=16, fontweight='bold', pad=20)
-plt.xticks(range(len(monthly_growth)), monthly_growth.index.astype(str), rotation=45, ha='right')
-plt.grid(axis='y', alpha=0.3)
-plt.tight_layout()
-plt.savefig('charts/growth_rate.png', dpi=300, bbox_inches='tight')
-plt.close()
-
-# Chart 14: Spending Distribution by Transaction Size
-plt.figure(figsize=(12, 6))
-bins = [0, 5, 10, 20, 50, 100, 200, 500, df['amount'].max()]
-labels = ['<₼5', '₼5-10', '₼10-20', '₼20-50', '₼50-100', '₼100-200', '₼200-500', '>₼500']
-df['amount_range'] = pd.cut(df['amount'], bins=bins, labels=labels)
-range_counts = df['amount_range'].value_counts().reindex(labels)
-
-colors_range = sns.color_palette("coolwarm", len(range_counts))
-bars = plt.bar(range(len(range_counts)), range_counts.values, color=colors_range,
-               edgecolor='black', linewidth=1.2)
-plt.xlabel('Transaction Size Range', fontsize=12, fontweight='bold')
-plt.ylabel('Number of Transactions', fontsize=12, fontweight='bold')
-plt.title('Distribution of Transactions by Amount Range', fontsize=16, fontweight='bold', pad=20)
-plt.xticks(range(len(labels)), labels, rotation=45, ha='right')
-plt.grid(axis='y', alpha=0.3)
-
-# Add value labels
-for i, val in enumerate(range_counts.values):
-    plt.text(i, val, f'{val:,}', ha='center', va='bottom', fontsize=9, fontweight='bold')
-
-plt.tight_layout()
-plt.savefig('charts/transaction_size_distribution.png', dpi=300, bbox_inches='tight')
-plt.close()
-
-# Chart 15: Average Spending by Month (Across All Years)
-plt.figure(figsize=(12, 6))
-avg_by_month = df.groupby('month')['amount'].mean()
-month_names = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
-               'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
-
-colors_months = sns.color_palette("husl", 12)
-bars = plt.bar(range(1, 13), avg_by_month.values, color=colors_months,
-               edgecolor='black', linewidth=1.2)
-plt.xlabel('Month', fontsize=12, fontweight='bold')
-plt.ylabel('Average Transaction Amount (₼)', fontsize=12, fontweight='bold')
-plt.title('Average Transaction Amount by Month (All Years)', fontsize=16, fontweight='bold', pad=20)
-plt.xticks(range(1, 13), month_names)
-plt.grid(axis='y', alpha=0.3)
-
-# Add value labels
-for i, val in enumerate(avg_by_month.values, 1):
-    plt.text(i, val, f'₼{val:.2f}', ha='center', va='bottom', fontsize=9, fontweight='bold')
-
-plt.tight_layout()
-plt.savefig('charts/avg_spending_by_month.png', dpi=300, bbox_inches='tight')
-plt.close()
-
-print("\n" + "=" * 60)
-print("All 15 charts created successfully in /charts folder!")
-print("=" * 60)
-
-# Generate enhanced insights data
-top_15_trans = df.nlargest(15, 'amount')[['date', 'category', 'amount']]
-yearly_totals = df.groupby('year')['amount'].sum()
-quarterly_totals = df.groupby('quarter')['amount'].sum()
-
-insights = {
-    'currency': 'AZN (Manat)',
-    'summary': {
-        'total_spent': float(df['amount'].sum()),
-        'total_transactions': int(len(df)),
-        'avg_transaction': float(df['amount'].mean()),
-        'median_transaction': float(df['amount'].median()),
-        'date_range': {
-            'start': str(df['date'].min().date()),
-            'end': str(df['date'].max().date()),
-            'total_days': int((df['date'].max() - df['date'].min()).days)
-        }
-    },
-    'categories': {
-        'breakdown': {k: float(v) for k, v in category_totals.to_dict().items()},
-        'transaction_counts': {k: int(v) for k, v in df['category'].value_counts().to_dict().items()},
-        'top_category': str(category_totals.idxmax()),
-        'top_category_amount': float(category_totals.max()),
-        'top_category_pct': float((category_totals.max() / df['amount'].sum()) * 100),
-        'category_averages': {k: float(v) for k, v in df.groupby('category')['amount'].mean().to_dict().items()}
-    },
-    'monthly': {
-        'avg_spending': float(monthly_totals.mean()),
-        'highest_month': str(monthly_totals.idxmax()),
-        'highest_month_amount': float(monthly_totals.max()),
-        'lowest_month': str(monthly_totals.idxmin()),
-        'lowest_month_amount': float(monthly_totals.min()),
-        'avg_monthly_transactions': float(df.groupby('year_month').size().mean())
-    },
-    'yearly': {
-        'breakdown': {str(k): float(v) for k, v in yearly_totals.to_dict().items()},
-        'avg_yearly_spending': float(yearly_totals.mean())
-    },
-    'quarterly': {
-        'breakdown': {str(k): float(v) for k, v in quarterly_totals.to_dict().items()},
-        'avg_quarterly_spending': float(quarterly_totals.mean())
-    },
-    'daily_patterns': {
-        'most_expensive_day': str(daily_spending['mean'].idxmax()),
-        'most_expensive_day_avg': float(daily_spending['mean'].max()),
-        'cheapest_day': str(daily_spending['mean'].idxmin()),
-        'cheapest_day_avg': float(daily_spending['mean'].min()),
-        'weekday_avg': float(daily_spending.loc[['Monday', 'Tuesday', 'Wednesday',
-                                            'Thursday', 'Friday']]['mean'].mean()),
-        'weekend_avg': float(daily_spending.loc[['Saturday', 'Sunday']]['mean'].mean())
-    },
-    'transaction_analysis': {
-        'small_transactions_pct': float((len(df[df['amount'] < 10]) / len(df)) * 100),
-        'medium_transactions_pct': float((len(df[(df['amount'] >= 10) & (df['amount'] <= 50)]) / len(df)) * 100),
-        'large_transactions_pct': float((len(df[df['amount'] > 50]) / len(df)) * 100),
-        'top_15_transactions': [
-            {
-                'date': str(row['date'].date()),
-                'category': str(row['category']),
-                'amount': float(row['amount'])
-            }
-            for _, row in top_15_trans.iterrows()
-        ]
-    },
-    'percentiles': {
-        f'{p}th': float(np.percentile(df['amount'], p))
-        for p in [10, 25, 50, 75, 90, 95, 99]
-    },
-    'savings_potential': {
-        'if_reduce_restaurant_20pct': float(category_totals.get('Restuarant', 0) * 0.20),
-        'if_reduce_coffee_30pct': float(category_totals.get('Coffe', 0) * 0.30),
-        'if_reduce_taxi_25pct': float(category_totals.get('Taxi', 0) * 0.25),
-        'total_potential_savings': float(
-            category_totals.get('Restuarant', 0) * 0.20 +
-            category_totals.get('Coffe', 0) * 0.30 +
-            category_totals.get('Taxi', 0) * 0.25
-        )
-    }
-}
+"""Expense ledger analysis: console report, charts and insights.json.
+
+Importable as a library; the plotting stack (matplotlib, seaborn) is only
+imported when charts are actually rendered::
+
+    import analyze_expenses as ae
 
-# Save insights to file
+    df = ae.load('budget.csv')
+    agg = ae.aggregate(df)
+    insights = ae.build_insights(agg)
+    ae.render_charts(agg, ['monthly_trend', 'spending_heatmap'])
+    ae.date_index(agg).query('2024-03-01', '2024-03-31', categories=['Coffe'])
+    ae.savings_model(agg).evaluate(cuts)     # what-if savings of many scenarios
+
+Run as a script for the full report (``--insights-only`` skips the charts).
+"""
+import argparse
 import json
-with open('insights.json', 'w') as f:
-    json.dump(insights, f, indent=2, default=str)
+import os
+
+import aggregates
+import anomalies
+import fx
+import ledger_store
+from aggregates import DAY_ORDER, PERCENTILES
+from instrument import METRICS_FILE, RunMetrics
+from ledger_cache import CACHE_DIR, load_ledger, memory_report
+
 
-print("\nInsights saved to insights.json")
+def _rates(fx_rates):
+    return fx.load_rates(fx_rates) if isinstance(fx_rates, (str, os.PathLike)) else fx_rates
+
+
+def load(csv_path='budget.csv', cache_dir=CACHE_DIR, use_cache=True, fx_rates=None):
+    """Load a ledger into the typed schema.
+
+    CSVs go through the ingestion cache; binary stores (see
+    :mod:`ledger_store`) are memory-mapped and need no cache. Amounts in a
+    ``currency`` column other than manat are converted with ``fx_rates``, a
+    rate file or :class:`fx.RateTable`.
+    """
+    if ledger_store.is_store(csv_path):
+        return ledger_store.LedgerStore(csv_path).frame()
+    df = load_ledger(csv_path, cache_dir=cache_dir, use_cache=use_cache)
+    return fx.normalize(df, _rates(fx_rates))
+
+
+def aggregate(source='budget.csv', stream=False, chunksize=aggregates.CHUNKSIZE,
+              fx_rates=None):
+    """Reduce a ledger to :class:`aggregates.Aggregates`.
+
+    ``source`` is either a frame returned by :func:`load` or the path of a
+    ledger CSV; with ``stream`` a path is aggregated in bounded-memory chunks.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        if stream and ledger_store.is_store(source):
+            return aggregates.merge_all(
+                aggregates.build(chunk, sketch=True)
+                for chunk in ledger_store.LedgerStore(source).frames(chunksize))
+        if stream:
+            return aggregates.stream(source, chunksize=chunksize, rates=_rates(fx_rates))
+        source = load(source, fx_rates=fx_rates)
+    return aggregates.build(source)
+
+
+def date_index(agg):
+    """Prefix-sum :class:`date_index.DateIndex` for fast date-range queries."""
+    from date_index import DateIndex
+
+    return DateIndex.from_aggregates(agg)
+
+
+def savings_model(agg):
+    """Month x category x weekday :class:`scenarios.SavingsModel` for what-if sweeps."""
+    from scenarios import SavingsModel
+
+    return SavingsModel.from_aggregates(agg)
+
+
+def _savings_potential(agg):
+    # The three standard scenarios and all of them together, in one batch
+    presets = [('if_reduce_restaurant_20pct', 'Restuarant', 0.20),
+               ('if_reduce_coffee_30pct', 'Coffe', 0.30),
+               ('if_reduce_taxi_25pct', 'Taxi', 0.25)]
+    model = savings_model(agg)
+    cuts = {category: cut for _, category, cut in presets}
+    batch = model.matrix([{'cuts': {category: cut}} for category, cut in cuts.items()] +
+                         [{'cuts': cuts}])
+    savings = model.evaluate(batch['cuts'])['savings']
+    result = {key: float(value) for (key, _, _), value in zip(presets, savings)}
+    result['total_potential_savings'] = float(savings[-1])
+    return result
+
+
+def render_charts(agg, selection=None, out_dir='charts', jobs=None, force=False,
+                  metrics=None, profile='print', skip=None):
+    """Render the charts named in ``selection`` (default: all of them).
+
+    ``profile`` is one of :data:`charts.RENDER_PROFILES` and ``skip`` names
+    charts to leave out. Returns ``(paths, rendered)`` as
+    :func:`charts.render_charts` does.
+    """
+    import charts  # deferred: importing matplotlib dominates start-up
+
+    return charts.render_charts(agg, out_dir=out_dir, jobs=jobs, force=force,
+                                selection=selection, metrics=metrics, profile=profile,
+                                skip=skip)
+
+
+def save_insights(insights, path='insights.json'):
+    with open(path, 'w') as f:
+        json.dump(insights, f, indent=2, default=str)
+
+
+def print_report(agg):
+    """Print the console summary of the aggregated ledger."""
+    category_stats = agg.rollup('category')
+    monthly_stats = agg.rollup('year_month')
+
+    # Print basic statistics
+    print("=" * 60)
+    print("EXPENSE DATA ANALYSIS")
+    print("=" * 60)
+    print(f"\nTotal Transactions: {agg.count:,}")
+    print(f"Date Range: {agg.date_min.date()} to {agg.date_max.date()}")
+    print(f"Total Spent: ₼{agg.total:,.2f}")
+    print(f"Average Transaction: ₼{agg.total / agg.count:.2f}")
+    print(f"Median Transaction: ₼{agg.median:.2f}")
+
+    # Category breakdown
+    print("\n" + "=" * 60)
+    print("SPENDING BY CATEGORY")
+    print("=" * 60)
+    category_table = category_stats.round(2)
+    category_table.columns = ['Total', 'Count', 'Avg']
+    category_table = category_table.sort_values('Total', ascending=False)
+    print(category_table)
+
+    # Monthly statistics
+    monthly_stats = monthly_stats.round(2)
+    monthly_stats.columns = ['Total', 'Transactions', 'Average']
+
+    print("\n" + "=" * 60)
+    print("MONTHLY SPENDING TRENDS")
+    print("=" * 60)
+    print(f"Average Monthly Spending: ₼{monthly_stats['Total'].mean():,.2f}")
+    print(f"Highest Month: {monthly_stats['Total'].idxmax()} (₼{monthly_stats['Total'].max():,.2f})")
+    print(f"Lowest Month: {monthly_stats['Total'].idxmin()} (₼{monthly_stats['Total'].min():,.2f})")
+
+
+def print_memory_report(df):
+    """Print resident memory per column of the typed ledger."""
+    usage = memory_report(df)
+    print("\n" + "=" * 60)
+    print("LEDGER MEMORY USAGE")
+    print("=" * 60)
+    for column, n in usage.items():
+        print(f"{column:<14} {str(df[column].dtype):<22} {n / 1024:>10,.1f} KiB")
+    print(f"{'total':<14} {'':<22} {sum(usage.values()) / 1024:>10,.1f} KiB")
+
+
+def detect_anomalies(df):
+    """Score every transaction of a loaded ledger; see :mod:`anomalies`.
+
+    Returns ``(scores, detector)``; the detector scores new transactions.
+    """
+    return anomalies.backfill(df)
+
+
+def build_insights(agg, anomaly_scores=None):
+    """Build the insights.json payload from the aggregated ledger.
+
+    With ``anomaly_scores`` (from :func:`detect_anomalies`) an ``anomalies``
+    section is added.
+    """
+    category_stats = agg.rollup('category')
+    category_totals = category_stats['sum'].sort_values(ascending=False)
+    monthly_stats = agg.rollup('year_month')
+    monthly_totals = monthly_stats['sum']
+    daily_spending = agg.rollup('day_of_week').reindex(DAY_ORDER)
+    top_15_trans = agg.top
+    yearly_totals = agg.rollup('year')['sum']
+    quarterly_totals = agg.rollup('quarter')['sum']
+
+    insights = {
+        'currency': 'AZN (Manat)',
+        'summary': {
+            'total_spent': agg.total,
+            'total_transactions': agg.count,
+            'avg_transaction': agg.total / agg.count,
+            'median_transaction': float(agg.median),
+            'date_range': {
+                'start': str(agg.date_min.date()),
+                'end': str(agg.date_max.date()),
+                'total_days': int((agg.date_max - agg.date_min).days)
+            }
+        },
+        'categories': {
+            'breakdown': {k: float(v) for k, v in category_totals.to_dict().items()},
+            'transaction_counts': {k: int(v) for k, v in category_stats['count'].sort_values(
+                ascending=False, kind='stable').to_dict().items()},
+            'top_category': str(category_totals.idxmax()),
+            'top_category_amount': float(category_totals.max()),
+            'top_category_pct': float((category_totals.max() / agg.total) * 100),
+            'category_averages': {k: float(v) for k, v in category_stats['mean'].to_dict().items()}
+        },
+        'monthly': {
+            'avg_spending': float(monthly_totals.mean()),
+            'highest_month': str(monthly_totals.idxmax()),
+            'highest_month_amount': float(monthly_totals.max()),
+            'lowest_month': str(monthly_totals.idxmin()),
+            'lowest_month_amount': float(monthly_totals.min()),
+            'avg_monthly_transactions': float(monthly_stats['count'].mean())
+        },
+        'yearly': {
+            'breakdown': {str(k): float(v) for k, v in yearly_totals.to_dict().items()},
+            'avg_yearly_spending': float(yearly_totals.mean())
+        },
+        'quarterly': {
+            'breakdown': {str(k): float(v) for k, v in quarterly_totals.to_dict().items()},
+            'avg_quarterly_spending': float(quarterly_totals.mean())
+        },
+        'daily_patterns': {
+            'most_expensive_day': str(daily_spending['mean'].idxmax()),
+            'most_expensive_day_avg': float(daily_spending['mean'].max()),
+            'cheapest_day': str(daily_spending['mean'].idxmin()),
+            'cheapest_day_avg': float(daily_spending['mean'].min()),
+            'weekday_avg': float(daily_spending.loc[['Monday', 'Tuesday', 'Wednesday',
+                                                'Thursday', 'Friday']]['mean'].mean()),
+            'weekend_avg': float(daily_spending.loc[['Saturday', 'Sunday']]['mean'].mean())
+        },
+        'transaction_analysis': {
+            'small_transactions_pct': float(agg.size_share('small')),
+            'medium_transactions_pct': float(agg.size_share('medium')),
+            'large_transactions_pct': float(agg.size_share('large')),
+            'top_15_transactions': [
+                {
+                    'date': str(row['date'].date()),
+                    'category': str(row['category']),
+                    'amount': float(row['amount'])
+                }
+                for _, row in top_15_trans.iterrows()
+            ]
+        },
+        'percentiles': {
+            f'{p}th': float(agg.percentiles[p])
+            for p in PERCENTILES
+        },
+        'savings_potential': _savings_potential(agg)
+    }
+    if anomaly_scores is not None:
+        insights['anomalies'] = anomalies.summarize(anomaly_scores)
+    return insights
+
+
+def analyze(csv_path='budget.csv', out_dir='.', jobs=None, use_cache=True,
+            force_charts=False, stream=False, chunksize=aggregates.CHUNKSIZE, verbose=True,
+            report_memory=False, insights_only=False, charts=None, profile_dir=None,
+            export_dir=None, render_profile='print', skip_charts=None, fx_rates=None,
+            trace_memory=None):
+    """Run the full analysis of one ledger.
+
+    Writes ``insights.json`` and (unless ``insights_only``) the ``charts/``
+    folder under ``out_dir`` and returns the insights dict. ``charts``
+    optionally limits rendering to the named charts and ``skip_charts`` leaves
+    charts out; ``render_profile`` picks print-quality PNGs (the default), a
+    cheap ``preview`` or ``thumbnail``, or ``vector``/``pdf`` output. With
+    ``export_dir`` the month x category, weekday x hour and daily cubes are
+    also written there as memory-mappable ``.npy`` files (see
+    :mod:`cube_export`). ``fx_rates`` is the rate file used to convert a
+    ledger with a ``currency`` column to manat (see :mod:`fx`). Except in
+    ``stream`` mode every transaction is
+    scored for anomalies and insights gain an ``anomalies`` section.
+
+    Every stage is instrumented and the measurements are written to
+    ``run_metrics.json`` next to ``insights.json``; with ``profile_dir`` a
+    cProfile dump is also written for each stage and each chart. Peak traced
+    memory per stage is recorded with ``trace_memory`` (default: only when
+    profiling), as it slows the data stages down.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    metrics = RunMetrics(profile_dir, trace_memory)
+
+    # Reduce to the base cube once; everything below is a rollup of it
+    if stream:
+        with metrics.stage('aggregate') as stage:
+            agg = aggregate(csv_path, stream=True, chunksize=chunksize, fx_rates=fx_rates)
+            stage['rows'] = agg.count
+    else:
+        # Read data (only rows appended since the last run are parsed)
+        with metrics.stage('load') as stage:
+            df = load(csv_path, cache_dir=os.path.join(out_dir, '.cache'), use_cache=use_cache,
+                      fx_rates=fx_rates)
+            stage['rows'] = len(df)
+            stage['parsed_rows'] = df.attrs.get('ingest', {}).get('parsed_rows', len(df))
+            if df.attrs.get('fx'):
+                stage['converted_rows'] = df.attrs['fx']
+        with metrics.stage('aggregate', rows=len(df)) as stage:
+            agg = aggregate(df)
+            stage['cube_rows'] = len(agg.cube)
+
+    if verbose:
+        with metrics.stage('report'):
+            print_report(agg)
+            if report_memory and not stream:
+                print_memory_report(df)
+
+    # Anomaly scores need the transactions, which stream mode never holds
+    scores = None
+    if not stream:
+        with metrics.stage('anomalies', rows=len(df)):
+            scores, _ = detect_anomalies(df)
+
+    with metrics.stage('insights'):
+        insights = build_insights(agg, scores)
+
+    # Save insights to file
+    with metrics.stage('save'):
+        save_insights(insights, os.path.join(out_dir, 'insights.json'))
+    if verbose:
+        print("\nInsights saved to insights.json")
+
+    # Render charts from the cube, skipping those whose inputs are unchanged;
+    # after insights.json so a chart failure never loses it
+    if not insights_only:
+        with metrics.stage('charts', profile=False, trace_memory=False) as stage:
+            paths, rendered = render_charts(agg, charts, out_dir=os.path.join(out_dir, 'charts'),
+                                            jobs=jobs, force=force_charts, metrics=metrics,
+                                            profile=render_profile, skip=skip_charts)
+            stage['rows'] = len(rendered)
+
+        if verbose:
+            print("\n" + "=" * 60)
+            print(f"All {len(paths)} charts created successfully in /charts folder!")
+            print(f"({len(rendered)} re-rendered, {len(paths) - len(rendered)} unchanged)")
+            print("=" * 60)
+
+    if export_dir:
+        import cube_export
+
+        with metrics.stage('export'):
+            cube_export.export(agg, os.path.join(out_dir, export_dir))
+
+    with open(os.path.join(out_dir, METRICS_FILE), 'w') as f:
+        json.dump(metrics.as_dict(), f, indent=2)
+    return insights
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Analyze expenses in budget.csv')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='re-parse the whole ledger instead of using the ingestion cache')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of chart rendering processes (default: one per CPU)')
+    parser.add_argument('--force-charts', action='store_true',
+                        help='re-render every chart even if its inputs are unchanged')
+    parser.add_argument('--stream', action='store_true',
+                        help='aggregate the ledger in bounded-memory chunks; '
+                             'percentiles become approximate (within 1%%)')
+    parser.add_argument('--chunksize', type=int, default=aggregates.CHUNKSIZE,
+                        help='rows per chunk in --stream mode (default: %(default)s)')
+    parser.add_argument('--memory-report', action='store_true',
+                        help='print the memory used by each column of the parsed ledger')
+    parser.add_argument('--insights-only', action='store_true',
+                        help='write insights.json without rendering charts '
+                             '(matplotlib is never imported)')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='do not print the console report')
+    parser.add_argument('--profile', nargs='?', const='profiles', default=None, metavar='DIR',
+                        help='write a cProfile dump per stage and per chart to DIR '
+                             '(default: %(const)s)')
+    parser.add_argument('--trace-memory', action='store_true', default=None,
+                        help='record the peak traced memory of each stage in run_metrics.json '
+                             '(slower; implied by --profile)')
+    # Mirrors charts.RENDER_PROFILES, which cannot be imported without matplotlib
+    parser.add_argument('--render-profile', default='print',
+                        choices=['print', 'preview', 'thumbnail', 'vector', 'pdf'],
+                        help='chart output: 300-DPI PNG (print), 72-DPI PNG (preview), '
+                             'small PNG (thumbnail), SVG (vector) or PDF (default: %(default)s)')
+    parser.add_argument('--charts', nargs='+', metavar='NAME',
+                        help='render only the named charts')
+    parser.add_argument('--skip-charts', nargs='+', metavar='NAME',
+                        help='do not render the named charts')
+    parser.add_argument('--fx-rates', metavar='CSV',
+                        help='date,currency,rate table for converting a ledger with a '
+                             'currency column to manat')
+    parser.add_argument('--export-cubes', nargs='?', const='cubes', default=None, metavar='DIR',
+                        help='also write the month x category, weekday x hour and daily '
+                             'cubes as memory-mappable .npy files to DIR (default: %(const)s)')
+    args = parser.parse_args()
+
+    analyze('budget.csv', jobs=args.jobs, use_cache=not args.no_cache,
+            force_charts=args.force_charts, stream=args.stream, chunksize=args.chunksize,
+            report_memory=args.memory_report, insights_only=args.insights_only,
+            verbose=not args.quiet, profile_dir=args.profile, export_dir=args.export_cubes,
+            charts=args.charts, skip_charts=args.skip_charts, render_profile=args.render_profile,
+            fx_rates=args.fx_rates, trace_memory=args.trace_memory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+"""Online anomaly scoring of transactions.
+
+Amounts are scored on a log scale (spending is roughly log-normal) against
+three baselines:
+
+``ew_z``
+    z-score against the category's exponentially weighted mean and variance
+    (half-life ``HALFLIFE`` transactions), i.e. relative to recent habits.
+``robust_z``
+    ``(x - median) / MAD`` within the category, from a
+    :class:`~sketches.QuantileSketch`; insensitive to the outliers themselves.
+``slot_z``
+    the same robust score against all spending in the transaction's weekday x
+    hour slot (the dimensions of the heatmap, Chart 6).
+
+A transaction's ``score`` is the middle one of the three, so it is flagged
+(``score >= THRESHOLD``) only when at least two baselines agree; any single
+one alone flags 0.5-5% of ``budget.csv``, the consensus under 1%. Only
+unusually *large* amounts score high, and nothing is scored until a baseline
+has seen ``MIN_HISTORY`` transactions.
+
+:class:`AnomalyDetector` keeps the running state: scoring or adding a
+transaction is O(1) -- the EW update is two multiply-adds, and the sketch
+medians/MADs are re-read every ``REFRESH`` additions, from at most a couple of
+thousand buckets -- so latency does not grow with the ledger;
+:func:`observe_frame` scores appended rows this way. :func:`backfill`
+scores a whole ledger at once: rows are grouped once by sorting on integer
+category and weekday-hour keys, the EW statistics are computed with the same
+recurrence by ``ewm()`` over each category, so ``ew_z`` matches scoring the
+ledger one transaction at a time, and the robust scores use the baselines of
+the whole history. It also returns the detector, ready to score new
+transactions.
+"""
+import numpy as np
+import pandas as pd
+
+from aggregates import DAY_ORDER, TOP_N
+from ledger_cache import MINOR_UNITS
+from sketches import QuantileSketch
+
+HALFLIFE = 50
+MIN_HISTORY = 10
+THRESHOLD = 3.5
+REFRESH = 32
+# Floor for the spread of a baseline, in log units (about 10%), so categories
+# with a fixed price (a phone plan) do not flag every cent of difference.
+MIN_SPREAD = 0.1
+
+
+def _robust(sketch):
+    """Median and MAD of log amounts from a sketch of amounts.
+
+    The MAD is taken as half the interquartile range, which equals it for
+    symmetric distributions and needs no second pass over the data.
+    """
+    q25, q50, q75 = np.log(sketch.quantiles([0.25, 0.5, 0.75]))
+    return q50, max((q75 - q25) / 2, MIN_SPREAD)
+
+
+def _z(x, center, spread):
+    return max((x - center) / spread, 0.0)
+
+
+class AnomalyDetector:
+    """Per-category and per weekday-hour baselines with O(1) updates."""
+
+    def __init__(self, halflife=HALFLIFE, threshold=THRESHOLD, min_history=MIN_HISTORY):
+        self.halflife = halflife
+        self.alpha = 1 - 0.5 ** (1 / halflife)
+        self.threshold = threshold
+        self.min_history = min_history
+        self.ew = {}          # category -> [count, mean, variance]
+        self.sketches = {}    # category or (weekday, hour) -> QuantileSketch
+        self._baselines = {}  # same keys -> (median, mad, sketch count when read)
+
+    def _baseline(self, key):
+        sketch = self.sketches.get(key)
+        if sketch is None or sketch.count < self.min_history:
+            return None
+        cached = self._baselines.get(key)
+        if cached is None or sketch.count - cached[2] >= REFRESH:
+            cached = (*_robust(sketch), sketch.count)
+            self._baselines[key] = cached
+        return cached[:2]
+
+    @staticmethod
+    def _slot(when):
+        when = pd.Timestamp(when)
+        if when.tz is not None:
+            when = when.tz_convert('UTC')
+        return when.dayofweek, when.hour
+
+    def score(self, when, category, amount):
+        """Score one transaction against the current state (without adding it)."""
+        result = {'ew_z': 0.0, 'robust_z': 0.0, 'slot_z': 0.0}
+        if amount > 0:
+            x = np.log(amount)
+            n, mean, var = self.ew.get(category, (0, 0.0, 0.0))
+            if n >= self.min_history:
+                result['ew_z'] = _z(x, mean, max(np.sqrt(var), MIN_SPREAD))
+            for name, key in (('robust_z', category), ('slot_z', self._slot(when))):
+                baseline = self._baseline(key)
+                if baseline is not None:
+                    result[name] = _z(x, *baseline)
+        result['score'] = sorted(result.values())[1]
+        result['flagged'] = result['score'] >= self.threshold
+        return result
+
+    def update(self, when, category, amount):
+        """Add one transaction to the running statistics."""
+        if amount <= 0:
+            return
+        x = np.log(amount)
+        state = self.ew.get(category)
+        if state is None:
+            self.ew[category] = [1, x, 0.0]
+        else:
+            delta = x - state[1]
+            state[0] += 1
+            state[1] += self.alpha * delta
+            state[2] = (1 - self.alpha) * (state[2] + self.alpha * delta * delta)
+        for key in (category, self._slot(when)):
+            self.sketches.setdefault(key, QuantileSketch()).add([amount])
+
+    def observe(self, when, category, amount):
+        """Score a new transaction, then add it; returns the score dict."""
+        result = self.score(when, category, amount)
+        self.update(when, category, amount)
+        return result
+
+
+def _median3(a, b, c):
+    return np.maximum(np.minimum(a, b), np.minimum(np.maximum(a, b), c))
+
+
+def _groups(keys):
+    """Stable grouping of small-integer ``keys``: the sort order and the
+    ``[start, end)`` run of each key in it."""
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]]) \
+        if len(keys) else np.zeros(0, np.int64)
+    ends = np.r_[starts[1:], len(keys)].astype(np.int64)
+    return order, sorted_keys, starts, ends
+
+
+def _grouped_robust_z(keys, amount, x, min_history):
+    """Robust z-score of every row against the sketch of its key.
+
+    Returns the scores and the sketch of each key.
+    """
+    order, sorted_keys, starts, ends = _groups(keys)
+    center = np.zeros(len(starts))
+    spread = np.full(len(starts), np.inf)  # too little history: z = 0
+    sketches = {}
+    for i, (lo, hi) in enumerate(zip(starts, ends)):
+        sketch = QuantileSketch().add(amount[order[lo:hi]])
+        sketches[sorted_keys[lo]] = sketch
+        if sketch.count >= min_history:
+            center[i], spread[i] = _robust(sketch)
+    group = np.repeat(np.arange(len(starts)), ends - starts)
+    z = np.empty(len(keys))
+    z[order] = np.maximum((x[order] - center[group]) / spread[group], 0)
+    return z, sketches
+
+
+def backfill(df, halflife=HALFLIFE, threshold=THRESHOLD, min_history=MIN_HISTORY):
+    """Score every transaction of a typed ledger (see :mod:`ledger_cache`).
+
+    Returns ``(scores, detector)``: a frame with one row per transaction in
+    date order, indexed like ``df``, and the detector holding the state after
+    the last one.
+    """
+    detector = AnomalyDetector(halflife, threshold, min_history)
+    df = df.sort_values('date', kind='stable')
+    amount = df['amount_minor'].to_numpy() / MINOR_UNITS
+    valid = amount > 0
+    category = df['category'].astype('category')
+    names = list(category.cat.categories.astype(str))
+    # Narrow integer keys: grouping them is a radix sort
+    codes = category.cat.codes.to_numpy()[valid]
+    slots = (df['day_of_week'].to_numpy().astype(np.int16) * 24
+             + df['hour'].to_numpy())[valid]
+    x = np.log(amount[valid])
+
+    # EW mean/variance after each transaction, per category in date order;
+    # the previous row of the same category holds the state each
+    # transaction was scored against.
+    order, sorted_codes, starts, ends = _groups(codes)
+    xs = x[order]
+    mean = np.empty(len(xs))
+    var = np.empty(len(xs))
+    prior_mean = np.full(len(xs), np.nan)
+    prior_var = np.full(len(xs), np.nan)
+    seen = np.empty(len(xs), dtype=np.int64)
+    for lo, hi in zip(starts, ends):
+        ewm = pd.Series(xs[lo:hi]).ewm(alpha=detector.alpha, adjust=False)
+        mean[lo:hi] = ewm.mean().to_numpy()
+        var[lo:hi] = ewm.var(bias=True).to_numpy()
+        prior_mean[lo + 1:hi] = mean[lo:hi - 1]
+        prior_var[lo + 1:hi] = var[lo:hi - 1]
+        seen[lo:hi] = np.arange(hi - lo)
+        detector.ew[names[sorted_codes[lo]]] = [int(hi - lo), float(mean[hi - 1]),
+                                                float(var[hi - 1])]
+    prior_std = np.maximum(np.sqrt(prior_var), MIN_SPREAD)
+    ew_z = np.zeros(len(x))
+    ew_z[order] = np.where(seen >= min_history, np.maximum((xs - prior_mean) / prior_std, 0), 0.0)
+
+    robust_z, sketches = _grouped_robust_z(codes, amount[valid], x, min_history)
+    for code, sketch in sketches.items():
+        detector.sketches[names[code]] = sketch
+    slot_z, sketches = _grouped_robust_z(slots, amount[valid], x, min_history)
+    for slot, sketch in sketches.items():
+        detector.sketches[(int(slot) // 24, int(slot) % 24)] = sketch
+
+    scores = pd.DataFrame({'date': df['date'], 'category': category, 'amount': amount})
+    for name, values in (('ew_z', ew_z), ('robust_z', robust_z), ('slot_z', slot_z)):
+        column = np.zeros(len(df))
+        column[valid] = values
+        scores[name] = column
+    scores['score'] = _median3(scores['ew_z'].to_numpy(), scores['robust_z'].to_numpy(),
+                               scores['slot_z'].to_numpy())
+    scores['flagged'] = scores['score'] >= threshold
+    return scores, detector
+
+
+def observe_frame(detector, df):
+    """Score the transactions of ``df`` one at a time in date order, adding
+    each to ``detector``; returns a frame shaped like :func:`backfill`'s.
+
+    Used for rows appended to an already scored ledger, at O(1) per row.
+    """
+    df = df.sort_values('date', kind='stable')
+    amount = df['amount_minor'].to_numpy() / MINOR_UNITS
+    category = df['category'].astype(str).to_numpy()
+    results = [detector.observe(when, name, value)
+               for when, name, value in zip(df['date'], category, amount)]
+    scores = pd.DataFrame({'date': df['date'], 'category': category, 'amount': amount})
+    for key in ('ew_z', 'robust_z', 'slot_z', 'score', 'flagged'):
+        scores[key] = [result[key] for result in results]
+    scores['flagged'] = scores['flagged'].astype(bool)
+    return scores
+
+
+def summarize(scores, threshold=THRESHOLD, top_n=TOP_N, halflife=HALFLIFE):
+    """The ``anomalies`` section of insights.json, for scores from
+    :func:`backfill` with the given ``threshold`` and ``halflife``."""
+    flagged = scores[scores['score'] >= threshold]
+    top = flagged.nlargest(top_n, 'score')
+    return {
+        'method': 'log-amount z-scores: EW per category (half-life '
+                  f'{halflife} transactions), median/MAD per category and per '
+                  'weekday-hour',
+        'threshold': threshold,
+        'flagged_transactions': int(len(flagged)),
+        'flagged_pct': float(len(flagged) / len(scores) * 100) if len(scores) else 0.0,
+        'by_category': {str(k): int(v)
+                        for k, v in flagged['category'].astype(str).value_counts().items()},
+        'by_weekday': {day: int((pd.to_datetime(flagged['date']).dt.dayofweek == i).sum())
+                       for i, day in enumerate(DAY_ORDER)},
+        'top_anomalies': [
+            {
+                'date': str(row['date'].date()),
+                'category': str(row['category']),
+                'amount': float(row['amount']),
+                'score': round(float(row['score']), 2),
+                'ew_z': round(float(row['ew_z']), 2),
+                'robust_z': round(float(row['robust_z']), 2),
+                'slot_z': round(float(row['slot_z']), 2),
+            }
+            for _, row in top.iterrows()
+        ],
+    }
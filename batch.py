@@ -0,0 +1,160 @@
+"""Analyze many household ledgers with a bounded pool of long-lived workers.
+
+Each worker imports pandas, matplotlib and seaborn and applies the chart
+style once, then processes ledgers until the batch is done, so the
+interpreter and import start-up cost is paid per worker instead of per
+ledger. Every ledger gets its own output directory holding ``insights.json``
+and ``charts/``; the batch writes ``batch_summary.json`` with per-ledger
+timings and failures.
+
+Usage::
+
+    python batch.py ledgers/ -o reports/ -w 8
+    python batch.py manifest.txt -o reports/
+
+A manifest is a text file with one ledger per line, optionally followed by a
+comma and the output directory for that ledger. Blank lines and lines
+starting with ``#`` are ignored.
+"""
+import argparse
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+SUMMARY_FILE = 'batch_summary.json'
+
+
+def find_ledgers(source, output_root):
+    """Return ``(ledger, out_dir)`` pairs for a directory or manifest file."""
+    if os.path.isdir(source):
+        pairs = []
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                if name.endswith('.csv'):
+                    ledger = os.path.join(root, name)
+                    rel = os.path.splitext(os.path.relpath(ledger, source))[0]
+                    pairs.append((ledger, os.path.join(output_root, rel)))
+        return sorted(pairs)
+
+    pairs = []
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            ledger, _, out_dir = (part.strip() for part in line.partition(','))
+            ledger = os.path.join(base, ledger)
+            if not out_dir:
+                out_dir = os.path.splitext(os.path.basename(ledger))[0]
+            pairs.append((ledger, os.path.join(output_root, out_dir)))
+    return pairs
+
+
+def _init_worker():
+    # Pay the heavy imports and style setup once per worker process.
+    import analyze_expenses  # noqa: F401
+    import charts
+    charts.setup_style()
+
+
+def _process(ledger, out_dir, options):
+    from analyze_expenses import analyze
+
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    result = {'ledger': ledger, 'output': out_dir, 'pid': os.getpid()}
+    try:
+        os.makedirs(out_dir, exist_ok=True)
+        insights = analyze(ledger, out_dir=out_dir, jobs=1, verbose=False, **options)
+        result.update(
+            status='ok',
+            total_transactions=insights['summary']['total_transactions'],
+            total_spent=insights['summary']['total_spent'],
+        )
+    except Exception as exc:
+        result.update(status='failed', error=f'{type(exc).__name__}: {exc}',
+                      traceback=traceback.format_exc())
+    result['seconds'] = time.perf_counter() - started
+    result['cpu_seconds'] = time.process_time() - cpu_started
+    return result
+
+
+def run_batch(pairs, workers=None, **options):
+    """Analyze every ``(ledger, out_dir)`` pair and return the batch summary.
+
+    ``options`` are passed on to :func:`analyze_expenses.analyze`.
+    """
+    workers = max(1, min(workers or os.cpu_count() or 1, len(pairs) or 1))
+    started = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = [pool.submit(_process, ledger, out_dir, options) for ledger, out_dir in pairs]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            print(f"[{len(results)}/{len(pairs)}] {result['status']:6} "
+                  f"{result['seconds']:7.2f}s  {result['ledger']}")
+
+    results.sort(key=lambda r: r['ledger'])
+    ok = [r for r in results if r['status'] == 'ok']
+    failed = [r for r in results if r['status'] != 'ok']
+    seconds = [r['seconds'] for r in results]
+    return {
+        'workers': workers,
+        'ledgers': len(results),
+        'succeeded': len(ok),
+        'failed': len(failed),
+        'wall_seconds': time.perf_counter() - started,
+        'ledger_seconds': {
+            'total': sum(seconds),
+            'mean': sum(seconds) / len(seconds) if seconds else 0.0,
+            'max': max(seconds, default=0.0),
+        },
+        'total_transactions': sum(r['total_transactions'] for r in ok),
+        'total_spent': sum(r['total_spent'] for r in ok),
+        'failures': [{'ledger': r['ledger'], 'error': r['error']} for r in failed],
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Analyze many expense ledgers in parallel')
+    parser.add_argument('source', help='directory of ledger CSVs or a manifest file')
+    parser.add_argument('-o', '--output', default='batch_output',
+                        help='root directory for per-ledger results (default: %(default)s)')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='number of worker processes (default: one per CPU)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='re-parse every ledger instead of using the ingestion cache')
+    parser.add_argument('--force-charts', action='store_true',
+                        help='re-render every chart even if its inputs are unchanged')
+    parser.add_argument('--render-profile', default='print',
+                        choices=['print', 'preview', 'thumbnail', 'vector', 'pdf'],
+                        help='chart output profile, e.g. thumbnail for galleries '
+                             '(default: %(default)s)')
+    parser.add_argument('--fx-rates', metavar='CSV',
+                        help='rate table for ledgers with a currency column; parsed once '
+                             'per worker')
+    args = parser.parse_args()
+
+    pairs = find_ledgers(args.source, args.output)
+    summary = run_batch(pairs, workers=args.workers, use_cache=not args.no_cache,
+                        force_charts=args.force_charts, render_profile=args.render_profile,
+                        fx_rates=args.fx_rates and os.path.abspath(args.fx_rates))
+
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, SUMMARY_FILE)
+    with open(path, 'w') as f:
+        json.dump(summary, f, indent=2, default=str)
+
+    print(f"\n{summary['succeeded']}/{summary['ledgers']} ledgers analyzed in "
+          f"{summary['wall_seconds']:.1f}s with {summary['workers']} workers; "
+          f"summary saved to {path}")
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
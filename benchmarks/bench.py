@@ -0,0 +1,241 @@
+"""Benchmark harness for the expense analysis pipeline.
+
+Generates synthetic ledgers shaped like ``budget.csv`` and times every stage
+of the pipeline separately, writing the results to a JSON file that can be
+compared against an earlier run::
+
+    python benchmarks/bench.py generate 1m
+    python benchmarks/bench.py run --sizes 10k 100k 1m -o results.json
+    python benchmarks/bench.py compare baseline.json results.json
+
+Synthetic ledgers use the same columns, the category mix and per-category
+amount levels of the real ledger (including the ``Restuarant``/``Coffe``/
+``Taxi`` spellings the savings section looks up) and ``+0000`` timestamps
+spread over the real ledger's span (July 2022 - November 2025), so larger
+sizes are denser rather than longer.
+They are written in chunks, so sizes up to 100M rows need no more memory
+than one chunk, and are cached under ``benchmarks/data/``.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import aggregates  # noqa: E402
+import analyze_expenses  # noqa: E402
+import ledger_cache  # noqa: E402
+
+DATA_DIR = os.path.join(ROOT, 'benchmarks', 'data')
+DEFAULT_SIZES = ['10k', '100k', '1m']
+GENERATE_CHUNK = 1_000_000
+# Every synthetic ledger spans the real one; larger sizes are denser, not
+# longer (a fixed gap ran 1M rows out to the year 2569).
+START = np.datetime64('2022-07-06T05:00:00', 's')
+END = np.datetime64('2025-11-30T00:00:00', 's')
+GENERATOR_VERSION = 2  # part of the cached file name
+
+# (category, share of transactions, mean amount) taken from budget.csv
+CATEGORY_MIX = [
+    ('Coffe', 1582, 9.09), ('Market', 1396, 7.71), ('Restuarant', 806, 23.39),
+    ('Transport', 775, 1.64), ('Taxi', 393, 4.37), ('Business lunch', 301, 9.51),
+    ('Phone', 171, 6.75), ('Other', 120, 14.09), ('Learning', 119, 30.99),
+    ('Events', 65, 67.57), ('Health', 63, 97.85), ('Communal', 62, 164.59),
+    ('Clothing', 62, 95.50), ('business_expenses', 38, 31.60), ('Sport', 34, 61.88),
+    ('joy', 18, 35.41), ('Tech', 17, 278.28), ('Barber', 14, 16.07),
+    ('Travel', 11, 355.50), ('Fuel', 10, 12.90), ('Film/enjoyment', 4, 8.59),
+    ('Rent Car', 2, 47.50), ('Motel', 1, 675.00),
+]
+
+# Rollups behind the charts and insights, timed one by one
+ROLLUPS = [
+    'category', 'year_month', ['year_month', 'category'], 'day_of_week',
+    ['day_of_week', 'hour'], ['year', 'month'], 'quarter', 'month', 'year',
+]
+
+
+def parse_size(text):
+    text = text.lower().replace('_', '')
+    scale = {'k': 10**3, 'm': 10**6}.get(text[-1])
+    return int(float(text[:-1]) * scale) if scale else int(text)
+
+
+def generate(path, rows, seed=0):
+    """Write a synthetic ledger of ``rows`` transactions to ``path``."""
+    rng = np.random.default_rng(seed)
+    names = np.array([name for name, _, _ in CATEGORY_MIX], dtype=object)
+    weights = np.array([n for _, n, _ in CATEGORY_MIX], dtype=float)
+    weights /= weights.sum()
+    means = np.array([mean for _, _, mean in CATEGORY_MIX])
+    sigma = 0.8
+    span = int((END - START) / np.timedelta64(1, 's'))
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write('date,category,amount\n')
+        for start in range(0, rows, GENERATE_CHUNK):
+            n = min(GENERATE_CHUNK, rows - start)
+            # Each chunk fills its share of the span, so the file stays sorted
+            lo, hi = span * start // rows, span * (start + n) // rows
+            offsets = np.sort(rng.integers(lo, max(hi, lo + 1), n))
+            stamps = START + offsets.astype('timedelta64[s]')
+            codes = rng.choice(len(names), size=n, p=weights)
+            # Log-normal amounts with the category's mean, rounded to qəpik
+            mu = np.log(means[codes]) - sigma ** 2 / 2
+            amounts = np.maximum(np.round(rng.lognormal(mu, sigma), 2), 0.05)
+            dates = np.char.add(np.char.replace(np.datetime_as_string(stamps, unit='s'), 'T', ' '),
+                                ' +0000')
+            pd.DataFrame({'date': dates, 'category': names[codes], 'amount': amounts}) \
+                .to_csv(f, header=False, index=False, lineterminator='\n')
+    os.replace(tmp, path)
+    return path
+
+
+def data_file(rows, seed=0):
+    return os.path.join(DATA_DIR, f'ledger_{rows}_{seed}_v{GENERATOR_VERSION}.csv')
+
+
+def ledger_path(rows, seed=0):
+    path = data_file(rows, seed)
+    if not os.path.exists(path):
+        print(f'generating {rows:,} rows -> {path}')
+        generate(path, rows, seed)
+    return path
+
+
+def _timed(timings, name, func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    timings[name] = time.perf_counter() - started
+    return result
+
+
+def run_once(path, charts=True, out_dir=None):
+    """Time every pipeline stage once on the ledger at ``path``."""
+    timings = {}
+    raw = _timed(timings, 'csv_load', pd.read_csv, path, dtype=ledger_cache.RAW_DTYPES)
+    df = _timed(timings, 'datetime_derivation', ledger_cache.parse_frame, raw)
+    del raw
+    agg = _timed(timings, 'aggregate', aggregates.build, df)
+    for by in ROLLUPS:
+        key = by if isinstance(by, str) else '+'.join(by)
+        _timed(timings, f'rollup.{key}', agg.rollup, by)
+    _timed(timings, 'rollup.size_bucket', agg.size_histogram)
+    _timed(timings, 'insights', analyze_expenses.build_insights, agg)
+
+    if charts:
+        import charts as chart_module
+
+        chart_module.setup_style()
+        out_dir = out_dir or os.path.join(DATA_DIR, 'charts')
+        os.makedirs(out_dir, exist_ok=True)
+        tasks = _timed(timings, 'chart_prepare', chart_module.prepare, agg)
+        for name, data in tasks.items():
+            _timed(timings, f'chart.{name}', chart_module.render, name, data, out_dir)
+    return timings
+
+
+def run(sizes, repeat=1, charts=True, seed=0):
+    results = {}
+    for size in sizes:
+        rows = parse_size(size)
+        path = ledger_path(rows, seed)
+        best = {}
+        for _ in range(repeat):
+            for stage, seconds in run_once(path, charts=charts).items():
+                best[stage] = min(seconds, best.get(stage, float('inf')))
+        best['total'] = sum(best.values())
+        results[str(rows)] = best
+        print(f'{rows:>12,} rows  {best["total"]:8.3f}s')
+    return {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'repeat': repeat,
+            'seed': seed,
+        },
+        'results': results,
+    }
+
+
+def compare(baseline, current, threshold=0.10, min_seconds=0.005):
+    """Return stages slower than ``baseline`` by more than ``threshold``."""
+    regressions = []
+    for rows, stages in current['results'].items():
+        before = baseline['results'].get(rows, {})
+        for stage, seconds in stages.items():
+            if stage not in before:
+                continue
+            if stage == 'total' and set(before) != set(stages):
+                continue  # different stage sets, e.g. with and without charts
+            old = before[stage]
+            if seconds - old > min_seconds and seconds > old * (1 + threshold):
+                regressions.append({'rows': int(rows), 'stage': stage, 'before': old,
+                                    'after': seconds, 'change': seconds / old - 1})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    gen = sub.add_parser('generate', help='write a synthetic ledger')
+    gen.add_argument('size', help='number of rows, e.g. 10k, 1m, 100m')
+    gen.add_argument('-o', '--output', help='output CSV (default: benchmarks/data/...)')
+    gen.add_argument('--seed', type=int, default=0)
+
+    bench = sub.add_parser('run', help='time every pipeline stage')
+    bench.add_argument('--sizes', nargs='+', default=DEFAULT_SIZES,
+                       help='ledger sizes (default: %(default)s)')
+    bench.add_argument('--repeat', type=int, default=1,
+                       help='runs per size; the fastest time per stage is kept')
+    bench.add_argument('--no-charts', action='store_true', help='skip chart rendering')
+    bench.add_argument('--seed', type=int, default=0)
+    bench.add_argument('-o', '--output', default='bench_results.json')
+
+    cmp = sub.add_parser('compare', help='flag regressions between two result files')
+    cmp.add_argument('baseline')
+    cmp.add_argument('current')
+    cmp.add_argument('--threshold', type=float, default=0.10,
+                     help='relative slowdown that counts as a regression (default: %(default)s)')
+
+    args = parser.parse_args()
+    if args.command == 'generate':
+        rows = parse_size(args.size)
+        path = args.output or data_file(rows, args.seed)
+        generate(path, rows, args.seed)
+        print(f'wrote {rows:,} rows to {path}')
+    elif args.command == 'run':
+        results = run(args.sizes, repeat=args.repeat, charts=not args.no_charts, seed=args.seed)
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'results saved to {args.output}')
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        regressions = compare(baseline, current, threshold=args.threshold)
+        for r in regressions:
+            print(f"REGRESSION {r['rows']:>12,} rows  {r['stage']:<40} "
+                  f"{r['before']:.4f}s -> {r['after']:.4f}s ({r['change']:+.0%})")
+        if not regressions:
+            print('no regressions')
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
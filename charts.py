@@ -0,0 +1,543 @@
+"""Chart rendering for the expense report.
+
+Each chart is an independent task: ``prepare()`` rolls the aggregation cube
+up into the small series a chart needs, and the chart function draws from
+those series alone. Tasks therefore never see the transactions and can be
+rendered in a pool of worker processes.
+"""
+import hashlib
+import inspect
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import seaborn as sns
+
+from aggregates import DAY_ORDER, PERCENTILES, SIZE_LABELS
+from instrument import measure
+
+MONTH_NAMES = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+               'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+DPI = 300
+MANIFEST = '.manifest.json'
+# Inputs are hashed at display precision so that changes nobody could see in
+# the rendered chart (e.g. a quantile moving by a fraction of a qəpik) do not
+# trigger a re-render.
+HASH_DECIMALS = 2
+
+# Output settings per render profile. ``print`` is the full-quality report;
+# the cheap profiles drop to screen resolution and skip the extra layout pass
+# of ``bbox_inches='tight'``.
+RENDER_PROFILES = {
+    'print': {'format': 'png', 'dpi': DPI, 'bbox_inches': 'tight'},
+    'preview': {'format': 'png', 'dpi': 72, 'bbox_inches': None},
+    'thumbnail': {'format': 'png', 'dpi': 24, 'bbox_inches': None},
+    'vector': {'format': 'svg', 'dpi': 72, 'bbox_inches': 'tight'},
+    'pdf': {'format': 'pdf', 'dpi': 72, 'bbox_inches': 'tight'},
+}
+DEFAULT_PROFILE = 'print'
+
+
+def setup_style():
+    sns.set_style("whitegrid")
+    plt.rcParams['figure.figsize'] = (12, 6)
+    plt.rcParams['font.size'] = 10
+
+
+def major_categories(category_totals):
+    """Category totals with categories under 2% of the total folded into one."""
+    total_amount = category_totals.sum()
+    threshold = total_amount * 0.02  # 2% threshold
+    major = category_totals[category_totals >= threshold].copy()
+    other_sum = category_totals[category_totals < threshold].sum()
+    if other_sum > 0:
+        major['Other (Combined)'] = other_sum
+    return major
+
+
+# Chart 1: Total Spending by Category (Pie Chart)
+def spending_by_category(major):
+    plt.figure(figsize=(14, 10))
+    colors = sns.color_palette("husl", len(major))
+
+    # Create pie chart with legend instead of labels
+    plt.pie(major, autopct='%1.1f%%', startangle=90, colors=colors,
+            pctdistance=0.85, textprops={'fontsize': 11, 'fontweight': 'bold'})
+
+    # Create legend with category names and amounts
+    legend_labels = [f'{cat}: ₼{val:,.0f}' for cat, val in major.items()]
+    plt.legend(legend_labels, loc='center left', bbox_to_anchor=(1, 0, 0.5, 1),
+               fontsize=11, frameon=True, fancybox=True, shadow=True)
+
+    plt.title('Spending Distribution by Category', fontsize=16, fontweight='bold', pad=20)
+
+
+# Chart 2: Monthly Spending Trend
+def monthly_trend(monthly_totals):
+    plt.figure(figsize=(14, 6))
+    plt.plot(monthly_totals.index.astype(str), monthly_totals.values,
+             marker='o', linewidth=2, markersize=6, color='#2E86AB')
+    plt.axhline(y=monthly_totals.mean(), color='r', linestyle='--',
+                label=f'Average: ₼{monthly_totals.mean():.2f}', linewidth=2)
+    plt.fill_between(range(len(monthly_totals)), monthly_totals.values,
+                     alpha=0.3, color='#2E86AB')
+    plt.xlabel('Month', fontsize=12, fontweight='bold')
+    plt.ylabel('Total Spending (₼)', fontsize=12, fontweight='bold')
+    plt.title('Monthly Spending Trend', fontsize=16, fontweight='bold', pad=20)
+    plt.xticks(rotation=45, ha='right')
+    plt.legend(fontsize=11)
+    plt.grid(True, alpha=0.3)
+
+
+# Chart 3: Category Spending Over Time (Stacked Area)
+def category_trends(category_monthly):
+    plt.figure(figsize=(14, 7))
+    category_monthly.plot(kind='area', stacked=True, alpha=0.7,
+                          colormap='tab10', ax=plt.gca())
+    plt.xlabel('Month', fontsize=12, fontweight='bold')
+    plt.ylabel('Spending (₼)', fontsize=12, fontweight='bold')
+    plt.title('Category Spending Trends Over Time', fontsize=16, fontweight='bold', pad=20)
+    plt.legend(title='Category', bbox_to_anchor=(1.05, 1), loc='upper left')
+    plt.xticks(rotation=45, ha='right')
+    plt.grid(True, alpha=0.3)
+
+
+# Chart 4: Average Daily Spending by Day of Week
+def spending_by_day(daily_means):
+    plt.figure(figsize=(12, 6))
+    colors_week = ['#FF6B6B' if day in ['Saturday', 'Sunday'] else '#4ECDC4'
+                   for day in DAY_ORDER]
+    plt.bar(range(len(DAY_ORDER)), daily_means, color=colors_week,
+            edgecolor='black', linewidth=1.2)
+    plt.xlabel('Day of Week', fontsize=12, fontweight='bold')
+    plt.ylabel('Average Spending per Transaction (₼)', fontsize=12, fontweight='bold')
+    plt.title('Average Spending by Day of Week', fontsize=16, fontweight='bold', pad=20)
+    plt.xticks(range(len(DAY_ORDER)), DAY_ORDER, rotation=45, ha='right')
+    plt.grid(axis='y', alpha=0.3)
+
+
+# Chart 5: Top Categories Bar Chart
+def category_totals(top_categories):
+    plt.figure(figsize=(12, 7))
+    colors_bar = sns.color_palette("RdYlGn_r", len(top_categories))
+    plt.barh(range(len(top_categories)), top_categories.values, color=colors_bar,
+             edgecolor='black', linewidth=1.2)
+    plt.yticks(range(len(top_categories)), top_categories.index, fontsize=11)
+    plt.xlabel('Total Spending (₼)', fontsize=12, fontweight='bold')
+    plt.title('Total Spending by Category', fontsize=16, fontweight='bold', pad=20)
+    plt.grid(axis='x', alpha=0.3)
+
+    # Add value labels
+    for i, (idx, val) in enumerate(top_categories.items()):
+        plt.text(val, i, f' ₼{val:,.0f}', va='center', fontsize=10, fontweight='bold')
+
+
+# Chart 6: Spending Heatmap by Hour and Day
+def spending_heatmap(hourly_daily):
+    plt.figure(figsize=(14, 8))
+    sns.heatmap(hourly_daily, cmap='YlOrRd', annot=False, fmt='.0f',
+                cbar_kws={'label': 'Total Spending (₼)'})
+    plt.xlabel('Hour of Day', fontsize=12, fontweight='bold')
+    plt.ylabel('Day of Week', fontsize=12, fontweight='bold')
+    plt.title('Spending Patterns by Day and Hour', fontsize=16, fontweight='bold', pad=20)
+
+
+# Chart 7: Transaction Count vs Amount by Category
+def transaction_analysis(category_counts, category_avg):
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(16, 6))
+
+    # Transaction count
+    colors_count = sns.color_palette("viridis", len(category_counts))
+    ax1.barh(range(len(category_counts)), category_counts.values,
+             color=colors_count, edgecolor='black', linewidth=1.2)
+    ax1.set_yticks(range(len(category_counts)))
+    ax1.set_yticklabels(category_counts.index)
+    ax1.set_xlabel('Number of Transactions', fontsize=12, fontweight='bold')
+    ax1.set_title('Transaction Frequency by Category', fontsize=14, fontweight='bold')
+    ax1.grid(axis='x', alpha=0.3)
+
+    # Average amount
+    colors_avg = sns.color_palette("plasma", len(category_avg))
+    ax2.barh(range(len(category_avg)), category_avg.values,
+             color=colors_avg, edgecolor='black', linewidth=1.2)
+    ax2.set_yticks(range(len(category_avg)))
+    ax2.set_yticklabels(category_avg.index)
+    ax2.set_xlabel('Average Transaction Amount (₼)', fontsize=12, fontweight='bold')
+    ax2.set_title('Average Spending per Transaction', fontsize=14, fontweight='bold')
+    ax2.grid(axis='x', alpha=0.3)
+
+
+# Chart 8: Spending Percentile Distribution
+def spending_percentiles(percentile_values):
+    plt.figure(figsize=(12, 6))
+    plt.bar([f'{p}th' for p in PERCENTILES], percentile_values,
+            color=sns.color_palette("coolwarm", len(PERCENTILES)),
+            edgecolor='black', linewidth=1.2)
+    plt.ylabel('Transaction Amount (₼)', fontsize=12, fontweight='bold')
+    plt.xlabel('Percentile', fontsize=12, fontweight='bold')
+    plt.title('Spending Distribution by Percentile', fontsize=16, fontweight='bold', pad=20)
+    plt.grid(axis='y', alpha=0.3)
+
+    # Add value labels
+    for i, val in enumerate(percentile_values):
+        plt.text(i, val, f'₼{val:.2f}', ha='center', va='bottom',
+                 fontsize=10, fontweight='bold')
+
+
+# Chart 9: Year-over-Year Comparison
+def year_over_year(yearly_data):
+    plt.figure(figsize=(14, 7))
+    for year in yearly_data.index:
+        plt.plot(range(1, 13), yearly_data.loc[year], marker='o', linewidth=2.5,
+                 markersize=8, label=str(year), alpha=0.8)
+
+    plt.xlabel('Month', fontsize=12, fontweight='bold')
+    plt.ylabel('Total Spending (₼)', fontsize=12, fontweight='bold')
+    plt.title('Year-over-Year Monthly Spending Comparison', fontsize=16, fontweight='bold', pad=20)
+    plt.xticks(range(1, 13), MONTH_NAMES)
+    plt.legend(title='Year', fontsize=11, loc='best')
+    plt.grid(True, alpha=0.3)
+
+
+# Chart 10: Quarterly Spending Trends
+def quarterly_trends(quarterly_data):
+    plt.figure(figsize=(12, 6))
+    quarters_str = [str(q) for q in quarterly_data.index]
+    plt.bar(range(len(quarterly_data)), quarterly_data.values,
+            color=sns.color_palette("viridis", len(quarterly_data)),
+            edgecolor='black', linewidth=1.2)
+    plt.xlabel('Quarter', fontsize=12, fontweight='bold')
+    plt.ylabel('Total Spending (₼)', fontsize=12, fontweight='bold')
+    plt.title('Quarterly Spending Trends', fontsize=16, fontweight='bold', pad=20)
+    plt.xticks(range(len(quarters_str)), quarters_str, rotation=45, ha='right')
+    plt.grid(axis='y', alpha=0.3)
+
+    # Add value labels
+    for i, val in enumerate(quarterly_data.values):
+        plt.text(i, val, f'₼{val:,.0f}', ha='center', va='bottom',
+                 fontsize=9, fontweight='bold')
+
+
+# Chart 11: Top 15 Most Expensive Transactions
+def top_transactions(top):
+    plt.figure(figsize=(12, 8))
+    colors_top = sns.color_palette("Reds_r", len(top))
+    plt.barh(range(len(top)), top['amount'],
+             color=colors_top, edgecolor='black', linewidth=1.2)
+    labels = [f"{row['category']} ({row['date'].strftime('%Y-%m-%d')})"
+              for _, row in top.iterrows()]
+    plt.yticks(range(len(top)), labels, fontsize=10)
+    plt.xlabel('Transaction Amount (₼)', fontsize=12, fontweight='bold')
+    plt.title('Top 15 Most Expensive Transactions', fontsize=16, fontweight='bold', pad=20)
+    plt.grid(axis='x', alpha=0.3)
+
+    # Add value labels
+    for i, val in enumerate(top['amount']):
+        plt.text(val, i, f' ₼{val:.2f}', va='center', fontsize=9, fontweight='bold')
+
+
+# Chart 12: Category Spending as Percentage (Donut Chart)
+def category_percentage(major, total):
+    plt.figure(figsize=(14, 10))
+
+    # Use major categories only (>2% threshold)
+    category_pct = (major / major.sum()) * 100
+    colors_donut = sns.color_palette("Set3", len(category_pct))
+
+    # Create donut chart with percentages only
+    plt.pie(category_pct, autopct='%1.1f%%', startangle=90, colors=colors_donut,
+            pctdistance=0.80, textprops={'fontsize': 11, 'fontweight': 'bold'})
+
+    # Draw circle for donut
+    centre_circle = plt.Circle((0, 0), 0.65, fc='white')
+    fig = plt.gcf()
+    fig.gca().add_artist(centre_circle)
+
+    # Add total in center
+    plt.text(0, 0, f'Total Spent:\n₼{total:,.0f}',
+             ha='center', va='center', fontsize=18, fontweight='bold')
+
+    # Create legend with category names
+    legend_labels = [f'{cat}' for cat in major.index]
+    plt.legend(legend_labels, loc='center left', bbox_to_anchor=(1, 0, 0.5, 1),
+               fontsize=11, frameon=True, fancybox=True, shadow=True)
+
+    plt.title('Category Distribution (% of Total Spending)', fontsize=16,
+              fontweight='bold', pad=20)
+
+
+# Chart 13: Monthly Growth Rate
+def growth_rate(monthly_growth):
+    plt.figure(figsize=(14, 6))
+    colors_growth = ['green' if x > 0 else 'red' for x in monthly_growth]
+
+    plt.bar(range(len(monthly_growth)), monthly_growth.values, color=colors_growth,
+            edgecolor='black', linewidth=1.2, alpha=0.7)
+    plt.axhline(y=0, color='black', linestyle='-', linewidth=1.5)
+    plt.xlabel('Month', fontsize=12, fontweight='bold')
+    plt.ylabel('Growth Rate (%)', fontsize=12, fontweight='bold')
+    plt.title('Month-over-Month Spending Growth Rate', fontsize=16, fontweight='bold', pad=20)
+    plt.xticks(range(len(monthly_growth)), monthly_growth.index.astype(str), rotation=45, ha='right')
+    plt.grid(axis='y', alpha=0.3)
+
+
+# Chart 14: Spending Distribution by Transaction Size
+def transaction_size_distribution(range_counts):
+    plt.figure(figsize=(12, 6))
+    colors_range = sns.color_palette("coolwarm", len(range_counts))
+    plt.bar(range(len(range_counts)), range_counts.values, color=colors_range,
+            edgecolor='black', linewidth=1.2)
+    plt.xlabel('Transaction Size Range', fontsize=12, fontweight='bold')
+    plt.ylabel('Number of Transactions', fontsize=12, fontweight='bold')
+    plt.title('Distribution of Transactions by Amount Range', fontsize=16, fontweight='bold', pad=20)
+    plt.xticks(range(len(SIZE_LABELS)), SIZE_LABELS, rotation=45, ha='right')
+    plt.grid(axis='y', alpha=0.3)
+
+    # Add value labels
+    for i, val in enumerate(range_counts.values):
+        plt.text(i, val, f'{val:,}', ha='center', va='bottom', fontsize=9, fontweight='bold')
+
+
+# Chart 15: Average Spending by Month (Across All Years)
+def avg_spending_by_month(avg_by_month):
+    plt.figure(figsize=(12, 6))
+    colors_months = sns.color_palette("husl", 12)
+    plt.bar(range(1, 13), avg_by_month.values, color=colors_months,
+            edgecolor='black', linewidth=1.2)
+    plt.xlabel('Month', fontsize=12, fontweight='bold')
+    plt.ylabel('Average Transaction Amount (₼)', fontsize=12, fontweight='bold')
+    plt.title('Average Transaction Amount by Month (All Years)', fontsize=16, fontweight='bold', pad=20)
+    plt.xticks(range(1, 13), MONTH_NAMES)
+    plt.grid(axis='y', alpha=0.3)
+
+    # Add value labels
+    for i, val in enumerate(avg_by_month.values, 1):
+        plt.text(i, val, f'₼{val:.2f}', ha='center', va='bottom', fontsize=9, fontweight='bold')
+
+
+# Output file stem -> drawing function, in report order
+CHARTS = {
+    'spending_by_category': spending_by_category,
+    'monthly_trend': monthly_trend,
+    'category_trends': category_trends,
+    'spending_by_day': spending_by_day,
+    'category_totals': category_totals,
+    'spending_heatmap': spending_heatmap,
+    'transaction_analysis': transaction_analysis,
+    'spending_percentiles': spending_percentiles,
+    'year_over_year': year_over_year,
+    'quarterly_trends': quarterly_trends,
+    'top_transactions': top_transactions,
+    'category_percentage': category_percentage,
+    'growth_rate': growth_rate,
+    'transaction_size_distribution': transaction_size_distribution,
+    'avg_spending_by_month': avg_spending_by_month,
+}
+
+
+def prepare(agg):
+    """Roll the cube up into the inputs of every chart.
+
+    Returns a dict mapping chart name to the keyword arguments of its drawing
+    function. Charts that do not apply to the data (e.g. year-over-year with a
+    single year) are left out.
+    """
+    by_category = agg.rollup('category')
+    totals = by_category['sum'].sort_values(ascending=False)
+    major = major_categories(totals)
+    monthly_totals = agg.rollup('year_month')['sum']
+    # Month-of-year charts always have 12 slots, whatever the ledger covers
+    yearly_data = agg.rollup(['year', 'month'])['sum'].unstack(fill_value=0) \
+        .reindex(columns=range(1, 13), fill_value=0)
+
+    data = {
+        'spending_by_category': {'major': major},
+        'monthly_trend': {'monthly_totals': monthly_totals},
+        'category_trends': {
+            'category_monthly': agg.rollup(['year_month', 'category'])['sum'].unstack(fill_value=0),
+        },
+        'spending_by_day': {'daily_means': agg.rollup('day_of_week')['mean'].reindex(DAY_ORDER)},
+        'category_totals': {'top_categories': totals.sort_values(ascending=True)},
+        'spending_heatmap': {
+            'hourly_daily': agg.rollup(['day_of_week', 'hour'])['sum'].unstack(fill_value=0)
+            .reindex(DAY_ORDER),
+        },
+        'transaction_analysis': {
+            'category_counts': by_category['count'].sort_values(ascending=True),
+            'category_avg': by_category['mean'].sort_values(ascending=True),
+        },
+        'spending_percentiles': {'percentile_values': [agg.percentiles[p] for p in PERCENTILES]},
+        'year_over_year': {'yearly_data': yearly_data},
+        'quarterly_trends': {'quarterly_data': agg.rollup('quarter')['sum']},
+        'top_transactions': {'top': agg.top.reset_index(drop=True)},
+        'category_percentage': {'major': major, 'total': totals.sum()},
+        'growth_rate': {'monthly_growth': monthly_totals.pct_change() * 100},
+        'transaction_size_distribution': {
+            'range_counts': agg.size_histogram(),
+        },
+        'avg_spending_by_month': {
+            'avg_by_month': agg.rollup('month')['mean'].reindex(range(1, 13), fill_value=0),
+        },
+    }
+    if len(yearly_data) <= 1:
+        del data['year_over_year']
+    return data
+
+
+def _canonical(value):
+    """Deterministic text form of a chart input, rounded to display precision."""
+    if isinstance(value, pd.DataFrame):
+        # Only numeric columns; rounding a datetime column warns
+        return value.round({c: HASH_DECIMALS for c in value.select_dtypes('number')}).to_csv()
+    if isinstance(value, pd.Series):
+        numeric = pd.api.types.is_numeric_dtype(value)
+        return (value.round(HASH_DECIMALS) if numeric else value).to_csv()
+    if isinstance(value, (list, tuple)):
+        return json.dumps([_canonical(v) for v in value])
+    if isinstance(value, (float, np.floating)):
+        return repr(round(float(value), HASH_DECIMALS))
+    return repr(value)
+
+
+def chart_file(name, profile=DEFAULT_PROFILE):
+    """File name of a chart: ``<name>.<ext>``, plus the profile name when
+    another profile writes the same format (``<name>.preview.png``)."""
+    ext = RENDER_PROFILES[profile]['format']
+    shared = sum(settings['format'] == ext for settings in RENDER_PROFILES.values()) > 1
+    return f'{name}.{profile}.{ext}' if shared and profile != DEFAULT_PROFILE else f'{name}.{ext}'
+
+
+def chart_hash(name, data, profile=DEFAULT_PROFILE):
+    """Hash of everything that determines a chart's pixels.
+
+    Covers the prepared input series, the source of the drawing function and
+    the shared style (i.e. every styling parameter), the render profile and
+    its output settings and the versions of the plotting stack.
+    """
+    digest = hashlib.sha256()
+    parts = [
+        inspect.getsource(CHARTS[name]),
+        inspect.getsource(setup_style),
+        f'profile={profile}:{json.dumps(RENDER_PROFILES[profile], sort_keys=True)}',
+        f'matplotlib={matplotlib.__version__}',
+        f'seaborn={sns.__version__}',
+        f'pandas={pd.__version__}',
+        f'numpy={np.__version__}',
+    ]
+    parts += [f'{key}={_canonical(data[key])}' for key in sorted(data)]
+    for part in parts:
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    # Entries are keyed by file name; drop any written under another key
+    return {key: entry for key, entry in manifest.items() if entry.get('file') == key}
+
+
+def _save_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, MANIFEST)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def render(name, data, out_dir='charts', profile=DEFAULT_PROFILE):
+    """Draw one chart from its prepared inputs and save it under ``out_dir``."""
+    settings = RENDER_PROFILES[profile]
+    CHARTS[name](**data)
+    path = os.path.join(out_dir, chart_file(name, profile))
+    plt.tight_layout()
+    plt.savefig(path, format=settings['format'], dpi=settings['dpi'],
+                bbox_inches=settings['bbox_inches'])
+    plt.close('all')
+    return path
+
+
+def _render_measured(name, data, out_dir, profile=DEFAULT_PROFILE, profile_dir=None):
+    with measure(f'chart.{name}', profile_dir, trace_memory=False) as record:
+        render(name, data, out_dir, profile)
+    return record
+
+
+def render_charts(agg, out_dir='charts', jobs=None, force=False, selection=None,
+                  metrics=None, profile=DEFAULT_PROFILE, skip=None):
+    """Render every applicable chart whose inputs changed since the last run.
+
+    ``selection`` limits rendering to the named charts (keys of ``CHARTS``)
+    and ``skip`` leaves the named charts out. ``profile`` picks the output
+    settings from ``RENDER_PROFILES``: ``print`` writes ``<name>.png`` at
+    300 DPI, ``vector`` and ``pdf`` write ``<name>.svg`` and ``<name>.pdf``
+    and the other PNG profiles ``<name>.<profile>.png`` next to it.
+
+    A manifest in ``out_dir`` records the :func:`chart_hash` each chart was
+    last rendered with; charts whose hash is unchanged and whose file still
+    exists are skipped unless ``force`` is set. Stale charts are rendered in
+    parallel when ``jobs`` > 1 (default: the number of CPUs).
+
+    With ``metrics`` (an :class:`instrument.RunMetrics`) each rendered
+    chart is measured -- in the worker that renders it -- and recorded as a
+    ``chart.<name>`` stage.
+
+    Returns ``(paths, rendered)``: every chart path in report order and the
+    names of the charts actually re-rendered.
+    """
+    if profile not in RENDER_PROFILES:
+        raise ValueError(f"unknown render profile: {profile} "
+                         f"(choose from {', '.join(RENDER_PROFILES)})")
+    unknown = sorted((set(selection or ()) | set(skip or ())) - set(CHARTS))
+    if unknown:
+        raise ValueError(f"unknown chart(s): {', '.join(unknown)}")
+    os.makedirs(out_dir, exist_ok=True)
+    tasks = prepare(agg)
+    tasks = {name: data for name, data in tasks.items()
+             if (selection is None or name in selection) and name not in (skip or ())}
+    # Manifest entries are keyed by file name, so each profile keeps its own.
+    files = {name: chart_file(name, profile) for name in tasks}
+    # Always loaded, even when forced: entries of unselected charts are kept.
+    manifest = _load_manifest(out_dir)
+    hashes = {name: chart_hash(name, data, profile) for name, data in tasks.items()}
+    paths = [os.path.join(out_dir, files[name]) for name in tasks]
+    stale = {
+        name: data for name, data in tasks.items()
+        if force or manifest.get(files[name], {}).get('hash') != hashes[name]
+        or not os.path.exists(os.path.join(out_dir, files[name]))
+    }
+
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    jobs = max(1, min(jobs, len(stale)))
+
+    if metrics is None:
+        task, extra = render, (profile,)
+    else:
+        task, extra = _render_measured, (profile, metrics.profile_dir)
+
+    if jobs == 1:
+        if stale:
+            setup_style()
+        results = [task(name, data, out_dir, *extra) for name, data in stale.items()]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=setup_style) as pool:
+            futures = [pool.submit(task, name, data, out_dir, *extra)
+                       for name, data in stale.items()]
+            results = [future.result() for future in futures]
+    if metrics is not None:
+        for record in results:
+            metrics.add(record)
+
+    for name in stale:
+        manifest[files[name]] = {'file': files[name], 'hash': hashes[name]}
+    _save_manifest(out_dir, manifest)
+    return paths, list(stale)
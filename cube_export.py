@@ -0,0 +1,139 @@
+"""Binary export of the analysis cubes for downstream consumers.
+
+The matrices behind the charts are written as plain ``.npy`` arrays next to a
+small ``index.json`` describing their shapes, dtypes and axis labels, so other
+jobs can memory-map them and slice without parsing anything or re-reading the
+ledger::
+
+    cube = cube_export.load('cubes')['month_category']    # read-only np.memmap
+    coffee = cube['sum'][:, cube['axes']['category'].index('Coffe')]
+
+Exported cubes (sums in manat as float64, counts as int64):
+
+==============  ===================  ==============================================
+cube            shape                axes
+==============  ===================  ==============================================
+month_category  months x categories  ``month`` ('YYYY-MM'), ``category`` (Chart 3)
+weekday_hour    7 x 24               ``weekday`` (Monday first), ``hour`` (Chart 6)
+daily           days                 ``day``: every calendar day, first to last
+==============  ===================  ==============================================
+
+Every export writes its arrays under new file names (tagged with a
+generation number kept in the index), then publishes ``index.json`` via a
+temporary file and :func:`os.replace`, and only then deletes the arrays of
+the previous export. A reader that loaded the old index keeps a consistent
+set: arrays it already mapped stay valid, and the new ones never overwrite
+them in place.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from aggregates import DAY_ORDER
+
+INDEX_FILE = 'index.json'
+EXPORT_VERSION = 1
+
+
+def cubes(agg):
+    """Dense month x category, weekday x hour and daily cubes of ``agg``."""
+    month_category = agg.rollup(['year_month', 'category'])[['sum', 'count']] \
+        .unstack(fill_value=0)
+    months = pd.period_range(agg.date_min, agg.date_max, freq='M') if agg.count else []
+    month_category = month_category.reindex(months, fill_value=0)
+    categories = list(month_category['sum'].columns.astype(str))
+
+    weekday_hour = agg.rollup(['day_of_week', 'hour'])[['sum', 'count']].unstack(fill_value=0)
+    weekday_hour = weekday_hour.reindex(index=DAY_ORDER, fill_value=0)
+    weekday_hour = weekday_hour.reindex(
+        columns=pd.MultiIndex.from_product([['sum', 'count'], range(24)]), fill_value=0)
+
+    daily = agg.cube.groupby('day')[['sum', 'count']].sum()
+    days = pd.date_range(daily.index.min(), daily.index.max(), freq='D') if len(daily) else []
+    daily = daily.reindex(days, fill_value=0)
+
+    return {
+        'month_category': {
+            'axes': {'month': [str(m) for m in months], 'category': categories},
+            'sum': month_category['sum'].to_numpy(np.float64),
+            'count': month_category['count'].to_numpy(np.int64),
+        },
+        'weekday_hour': {
+            'axes': {'weekday': DAY_ORDER, 'hour': list(range(24))},
+            'sum': weekday_hour['sum'].to_numpy(np.float64),
+            'count': weekday_hour['count'].to_numpy(np.int64),
+        },
+        'daily': {
+            'axes': {'day': {'start': str(days[0].date()) if len(days) else None,
+                             'freq': 'D', 'length': len(days)}},
+            'sum': daily['sum'].to_numpy(np.float64),
+            'count': daily['count'].to_numpy(np.int64),
+        },
+    }
+
+
+def _replace(path, write):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'wb') as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+def _files(index):
+    return {meta['file'] for entry in index['cubes'].values()
+            for meta in entry['arrays'].values()}
+
+
+def _read_index(out_dir):
+    try:
+        with open(os.path.join(out_dir, INDEX_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def export(agg, out_dir='cubes'):
+    """Write the cubes of ``agg`` to ``out_dir``; return the index path."""
+    os.makedirs(out_dir, exist_ok=True)
+    old = _read_index(out_dir)
+    generation = old.get('generation', 0) + 1 if old else 1
+    index = {'version': EXPORT_VERSION, 'generation': generation,
+             'currency': 'AZN (Manat)', 'cubes': {}}
+    for name, cube in cubes(agg).items():
+        entry = {'axes': cube['axes'], 'arrays': {}}
+        for field in ('sum', 'count'):
+            array = np.ascontiguousarray(cube[field])
+            filename = f'{name}.{field}.{generation}.npy'
+            _replace(os.path.join(out_dir, filename), lambda f: np.save(f, array))
+            entry['arrays'][field] = {'file': filename, 'dtype': array.dtype.str,
+                                      'shape': list(array.shape)}
+        index['cubes'][name] = entry
+
+    path = os.path.join(out_dir, INDEX_FILE)
+    _replace(path, lambda f: f.write(json.dumps(index, indent=2).encode()))
+
+    if old and 'cubes' in old:
+        for filename in _files(old) - _files(index):
+            try:
+                os.remove(os.path.join(out_dir, filename))
+            except FileNotFoundError:
+                pass
+    return path
+
+
+def load(out_dir='cubes', mmap_mode='r'):
+    """Open an export; arrays are memory-mapped unless ``mmap_mode`` is None.
+
+    Returns a dict mapping cube name to its ``axes`` and one array per field.
+    """
+    with open(os.path.join(out_dir, INDEX_FILE)) as f:
+        index = json.load(f)
+    result = {}
+    for name, entry in index['cubes'].items():
+        result[name] = {'axes': entry['axes']}
+        for field, meta in entry['arrays'].items():
+            result[name][field] = np.load(os.path.join(out_dir, meta['file']),
+                                          mmap_mode=mmap_mode)
+    return result
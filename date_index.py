@@ -0,0 +1,131 @@
+"""Prefix-sum index for arbitrary date-range queries.
+
+:class:`DateIndex` lays the aggregation cube out on a dense day axis and
+stores, per category, the cumulative daily sums and counts. The total, count
+or mean over any inclusive date range and any set of categories is then two
+row lookups and a subtraction -- independent of the number of transactions
+and of the length of the range::
+
+    index = DateIndex.from_aggregates(agg)
+    index.query('2024-03-03', '2024-04-17', categories=['Coffe'])
+    index.query_many(starts, ends)          # thousands of windows at once
+
+Days are UTC calendar days, like the rest of the analysis. Sums are kept in
+qəpik so they stay exact however long the prefix; memory is
+``(days + 1) x categories x 16`` bytes, about 1.7 MB for ten years of 30
+categories.
+"""
+import numpy as np
+import pandas as pd
+
+from ledger_cache import MINOR_UNITS
+
+
+def _to_days(values):
+    """Dates (strings, datetimes, tz-aware or not) as datetime64[D] UTC days."""
+    values = pd.to_datetime(pd.Series(values), format='mixed', utc=True)
+    return values.dt.tz_localize(None).values.astype('datetime64[D]')
+
+
+class DateIndex:
+    def __init__(self, first_day, categories, cum_sum, cum_count):
+        self.first_day = np.datetime64(first_day, 'D')
+        self.categories = list(categories)
+        self._columns = {category: i for i, category in enumerate(self.categories)}
+        # Row i holds the totals of all days before first_day + i.
+        self.cum_sum = cum_sum
+        self.cum_count = cum_count
+
+    @property
+    def days(self):
+        return len(self.cum_sum) - 1
+
+    @property
+    def last_day(self):
+        return self.first_day + np.timedelta64(self.days - 1, 'D')
+
+    @classmethod
+    def from_aggregates(cls, agg):
+        """Build the index from :class:`aggregates.Aggregates`."""
+        daily = agg.cube.groupby(['day', 'category'], observed=True)[['sum', 'count']].sum()
+        days = daily.index.get_level_values('day').values.astype('datetime64[D]')
+        categories = sorted(daily.index.get_level_values('category').unique().astype(str))
+        if len(days) == 0:
+            return cls(np.datetime64('1970-01-01'), categories,
+                       np.zeros((1, len(categories)), np.int64),
+                       np.zeros((1, len(categories)), np.int64))
+
+        first_day = days.min()
+        rows = (days - first_day).astype(np.int64)
+        cols = pd.Categorical(daily.index.get_level_values('category').astype(str),
+                              categories=categories).codes
+        n_days = int(rows.max()) + 1
+        sums = np.zeros((n_days + 1, len(categories)), dtype=np.int64)
+        counts = np.zeros((n_days + 1, len(categories)), dtype=np.int64)
+        # Scatter into row r + 1 so the cumulative sum starts with a zero row.
+        minor = np.rint(daily['sum'].to_numpy() * MINOR_UNITS).astype(np.int64)
+        np.add.at(sums, (rows + 1, cols), minor)
+        np.add.at(counts, (rows + 1, cols), daily['count'].to_numpy())
+        return cls(first_day, categories, np.cumsum(sums, axis=0), np.cumsum(counts, axis=0))
+
+    def merge(self, other):
+        """Index over the transactions of both indexes, e.g. a ledger and the
+        rows appended to it, without going back to the cube."""
+        parts = [index for index in (self, other) if index.days]
+        if len(parts) < 2:
+            return parts[0] if parts else self
+        categories = sorted(set(self.categories) | set(other.categories))
+        first_day = min(index.first_day for index in parts)
+        last_day = max(index.last_day for index in parts)
+        n_days = int((last_day - first_day).astype(np.int64)) + 1
+        cum_sum = np.zeros((n_days + 1, len(categories)), dtype=np.int64)
+        cum_count = np.zeros_like(cum_sum)
+        for index in parts:
+            # Each prefix sum is zero before its first day and flat after its last.
+            lo = int((index.first_day - first_day).astype(np.int64))
+            hi = lo + index.days + 1
+            cols = np.searchsorted(categories, index.categories)
+            for out, cum in ((cum_sum, index.cum_sum), (cum_count, index.cum_count)):
+                out[lo:hi, cols] += cum
+                out[hi:, cols] += cum[-1]
+        return DateIndex(first_day, categories, cum_sum, cum_count)
+
+    def _positions(self, days, end):
+        """Row of the prefix sums bounding each day (inclusive on both ends)."""
+        offsets = (days - self.first_day).astype(np.int64)
+        return np.clip(offsets + (1 if end else 0), 0, self.days)
+
+    def _mask(self, categories):
+        if categories is None:
+            return np.ones(len(self.categories), dtype=bool)
+        mask = np.zeros(len(self.categories), dtype=bool)
+        for category in categories:
+            if category in self._columns:
+                mask[self._columns[category]] = True
+        return mask
+
+    def query_many(self, starts, ends, categories=None):
+        """Totals, counts and means for many inclusive ``[start, end]`` windows.
+
+        ``starts``/``ends`` are array-likes of dates. ``categories`` is either
+        one list of categories applied to every window, a boolean matrix of
+        shape ``(windows, len(self.categories))``, or None for all categories.
+        Returns a dict of ``total``, ``count`` and ``mean`` arrays.
+        """
+        lo = self._positions(_to_days(starts), end=False)
+        hi = np.maximum(self._positions(_to_days(ends), end=True), lo)
+
+        sums = self.cum_sum[hi] - self.cum_sum[lo]
+        counts = self.cum_count[hi] - self.cum_count[lo]
+        mask = categories if isinstance(categories, np.ndarray) and categories.ndim == 2 \
+            else self._mask(categories)
+        total = (sums * mask).sum(axis=1) / MINOR_UNITS
+        count = (counts * mask).sum(axis=1)
+        mean = np.where(count > 0, total / np.maximum(count, 1), np.nan)
+        return {'total': total, 'count': count, 'mean': mean}
+
+    def query(self, start=None, end=None, categories=None):
+        """Total, count and mean over ``[start, end]`` (open bounds if None)."""
+        result = self.query_many([self.first_day if start is None else start],
+                                 [self.last_day if end is None else end], categories)
+        return {key: value[0].item() for key, value in result.items()}
@@ -0,0 +1,126 @@
+"""Lightweight per-stage instrumentation for analysis runs.
+
+Every stage of a run is wrapped in :meth:`RunMetrics.stage`, which records
+wall time, CPU time, the process's peak resident set size so far and an
+optional row count. With a profile directory each stage additionally writes a
+cProfile dump that can be opened with ``pstats`` or snakeviz.
+
+Peak traced memory per stage (via :mod:`tracemalloc`, which also sees numpy
+and pandas buffers) is opt-in: tracemalloc hooks every allocation, which
+roughly triples the time of allocation-heavy stages such as
+``build_insights``, so it is only enabled when profiling or when asked for.
+Chart stages never trace memory; it makes matplotlib several times slower.
+"""
+import cProfile
+import os
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+from contextlib import contextmanager
+
+METRICS_FILE = 'run_metrics.json'
+
+
+# Open measurements, innermost last. tracemalloc has a single peak counter,
+# so an inner stage hands its peak up to the stages enclosing it.
+_open = []
+
+
+def max_rss_bytes():
+    """Peak resident set size of this process so far (None if unavailable)."""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+@contextmanager
+def measure(name, profile_dir=None, trace_memory=False):
+    """Measure the enclosed block; yields the (mutable) record dict.
+
+    Set ``record['rows']`` inside the block to attach a row count. Peak
+    traced memory is recorded with ``trace_memory`` (or if an enclosing
+    block is already tracing).
+    """
+    trace_memory = trace_memory or tracemalloc.is_tracing()
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    if trace_memory:
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+    # Only one profiler can be active at a time; nested stages are covered by
+    # an enclosing profile.
+    profiling = bool(profile_dir) and not any(f['profiling'] for f in _open)
+    profiler = cProfile.Profile() if profiling else None
+
+    record = {'stage': name}
+    frame = {'peak': 0, 'profiling': profiling}
+    _open.append(frame)
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    if profiler:
+        profiler.enable()
+    try:
+        yield record
+    finally:
+        if profiler:
+            profiler.disable()
+        record['wall_seconds'] = time.perf_counter() - wall
+        record['cpu_seconds'] = time.process_time() - cpu
+        record['max_rss_bytes'] = max_rss_bytes()
+        _open.pop()
+        if trace_memory:
+            peak = max(tracemalloc.get_traced_memory()[1], frame['peak'])
+            record['peak_memory_bytes'] = max(peak - base, 0)
+            if _open:
+                _open[-1]['peak'] = max(_open[-1]['peak'], peak)
+        if started_tracing:
+            tracemalloc.stop()
+        if profiler:
+            os.makedirs(profile_dir, exist_ok=True)
+            path = os.path.join(profile_dir, f'{name}.prof')
+            profiler.dump_stats(path)
+            record['profile'] = path
+
+
+class RunMetrics:
+    """Collects stage records for one run.
+
+    Stages trace memory if ``trace_memory`` is set, which by default it is
+    only when profiling.
+    """
+
+    def __init__(self, profile_dir=None, trace_memory=None):
+        self.profile_dir = profile_dir
+        self.trace_memory = bool(profile_dir) if trace_memory is None else trace_memory
+        self.stages = []
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name, rows=None, profile=True, trace_memory=True):
+        """Measure a stage; ``profile``/``trace_memory`` False opt it out."""
+        with measure(name, self.profile_dir if profile else None,
+                     self.trace_memory and trace_memory) as record:
+            if rows is not None:
+                record['rows'] = rows
+            yield record
+        self.stages.append(record)
+
+    def add(self, record):
+        """Add a record measured elsewhere, e.g. in a worker process."""
+        self.stages.append(record)
+
+    def as_dict(self):
+        return {
+            'wall_seconds': time.perf_counter() - self._started,
+            'peak_memory_bytes': max((s.get('peak_memory_bytes', 0) for s in self.stages),
+                                     default=0),
+            'max_rss_bytes': max_rss_bytes(),
+            'stages': self.stages,
+        }
@@ -0,0 +1,259 @@
+"""Incremental ingestion cache for the expense ledger.
+
+The ledger only ever grows by appending rows, so instead of re-parsing the
+whole CSV on every run we keep a parsed snapshot next to a small state file
+recording how many bytes / rows it covers and a fingerprint of those bytes.
+A run then parses only the bytes appended since the snapshot was written and
+falls back to a full rebuild when anything before that point has changed.
+
+Parsed ledgers use an explicit compact schema:
+
+============  ====================  ===========================================
+column        dtype                 meaning
+============  ====================  ===========================================
+date          datetime64 (UTC)      parsed with the fixed ``DATE_FORMAT``
+category      category              stable code table, new categories appended
+amount_minor  int64                 amount in qəpik (rounded to the nearest)
+day           int32                 days since 1970-01-01
+year          int16
+month         int8                  1-12
+year_month    int16                 months since 1970-01 (Period ordinal)
+day_of_week   int8                  0 = Monday ... 6 = Sunday
+hour          int8                  0-23
+currency      category              only if the CSV has a ``currency`` column
+============  ====================  ===========================================
+
+``amount_minor`` is in the transaction's own currency here; :mod:`fx`
+converts it to the reporting currency after loading, so cached snapshots
+stay valid when the rate table changes.
+"""
+import hashlib
+import io
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = '.cache'
+CACHE_VERSION = 3
+HASH_BLOCK = 1 << 20
+
+# Ledger timestamps look like '2022-07-06 05:57:10 +0000'. They are ISO 8601,
+# and pandas' dedicated ISO parser handles them about 5x faster than the
+# equivalent strptime pattern '%Y-%m-%d %H:%M:%S %z'.
+DATE_FORMAT = 'ISO8601'
+MINOR_UNITS = 100
+NS_PER_HOUR = 3600 * 10**9
+NS_PER_DAY = 24 * NS_PER_HOUR
+RAW_DTYPES = {'date': str, 'category': 'category', 'amount': float, 'currency': 'category'}
+
+
+def _fingerprint(path, length):
+    """Hash the first ``length`` bytes of ``path``; returns the digest object."""
+    digest = hashlib.blake2b(digest_size=20)
+    remaining = length
+    with open(path, 'rb') as f:
+        while remaining > 0:
+            block = f.read(min(HASH_BLOCK, remaining))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+    return digest
+
+
+def _cache_paths(csv_path, cache_dir):
+    stem = os.path.splitext(os.path.basename(csv_path))[0]
+    return (os.path.join(cache_dir, f'{stem}.state.json'),
+            os.path.join(cache_dir, f'{stem}.snapshot.pkl'))
+
+
+def parse_frame(raw, categories=None):
+    """Convert a raw ``date, category, amount`` frame to the typed schema.
+
+    ``categories`` is the existing code table; categories not in it are
+    appended (in sorted order) so existing codes never change. The returned
+    frame's code table is ``df['category'].cat.categories``. Rows with a
+    blank amount are dropped, as the totals always skipped them.
+    """
+    amount = raw['amount'].to_numpy(dtype=float)
+    if np.isnan(amount).any():
+        keep = ~np.isnan(amount)
+        raw, amount = raw[keep].reset_index(drop=True), amount[keep]
+    date = pd.to_datetime(raw['date'], format=DATE_FORMAT)
+
+    category = raw['category'].astype('category')
+    table = list(categories or [])
+    known = set(table)
+    table += [c for c in category.cat.categories if c not in known]
+    category = category.cat.set_categories(table)
+
+    df = derive_columns(pd.DataFrame({
+        'date': date,
+        'category': category,
+        'amount_minor': np.rint(amount * MINOR_UNITS).astype(np.int64),
+    }, index=raw.index))
+    if 'currency' in raw:
+        df['currency'] = raw['currency'].astype('category')
+    return df
+
+
+def derive_columns(df):
+    """Add the small-integer calendar columns used as grouping keys."""
+    date = df['date']
+    if date.dt.tz is not None:
+        date = date.dt.tz_convert('UTC').dt.tz_localize(None)
+    # The calendar keys go through nanoseconds, which would silently wrap
+    if len(date) and (date.min() < pd.Timestamp.min or date.max() > pd.Timestamp.max):
+        raise ValueError(f'dates must lie between {pd.Timestamp.min} and {pd.Timestamp.max}, '
+                         f'got {date.min()} to {date.max()}')
+    ns = date.to_numpy(dtype='datetime64[ns]').view(np.int64)
+    days = ns // NS_PER_DAY
+    df['day'] = days.astype(np.int32)
+    df['year'] = date.dt.year.astype(np.int16)
+    df['month'] = date.dt.month.astype(np.int8)
+    df['year_month'] = ((df['year'].astype(np.int32) - 1970) * 12 + df['month'] - 1).astype(np.int16)
+    df['day_of_week'] = ((days + 3) % 7).astype(np.int8)  # 1970-01-01 was a Thursday
+    df['hour'] = (ns // NS_PER_HOUR % 24).astype(np.int8)
+    return df
+
+
+def memory_report(df):
+    """Resident bytes per column (deep, i.e. including Python objects)."""
+    usage = df.memory_usage(deep=True, index=False)
+    return {column: int(n) for column, n in usage.items()}
+
+
+def read_csv(path_or_buffer, categories=None, **kwargs):
+    """Read a ledger CSV straight into the typed schema."""
+    raw = pd.read_csv(path_or_buffer, dtype=RAW_DTYPES, **kwargs)
+    return parse_frame(raw, categories)
+
+
+def _parse(data, columns, categories):
+    if not data.strip():
+        return None
+    return read_csv(io.BytesIO(data), categories, header=None, names=columns)
+
+
+def _concat(*frames):
+    frames = [f for f in frames if f is not None]
+    if len(frames) <= 1:
+        return frames[0] if frames else None
+    # Later frames extend the code table of earlier ones, so widening every
+    # frame to the last table keeps the codes and the categorical dtype.
+    table = frames[-1]['category'].cat.categories
+    for frame in frames[:-1]:
+        frame['category'] = frame['category'].cat.set_categories(table)
+    if 'currency' in frames[0]:
+        currencies = sorted(set().union(*(f['currency'].cat.categories for f in frames)))
+        for frame in frames:
+            frame['currency'] = frame['currency'].cat.set_categories(currencies)
+    return pd.concat(frames, ignore_index=True)
+
+
+def _empty(columns, categories):
+    raw = pd.DataFrame({c: pd.Series(dtype=object) for c in columns})
+    raw['amount'] = raw['amount'].astype(float)
+    return parse_frame(raw, categories)
+
+
+def _load_state(state_path, snapshot_path):
+    if not (os.path.exists(state_path) and os.path.exists(snapshot_path)):
+        return None
+    try:
+        with open(state_path) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if state.get('version') != CACHE_VERSION:
+        return None
+    return state
+
+
+def _save(state_path, snapshot_path, state, snapshot):
+    # Write to temporary files first so an interrupted run never leaves a
+    # state file describing a snapshot it does not match.
+    snapshot.to_pickle(snapshot_path + '.tmp')
+    with open(state_path + '.tmp', 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(snapshot_path + '.tmp', snapshot_path)
+    os.replace(state_path + '.tmp', state_path)
+
+
+def load_ledger(csv_path='budget.csv', cache_dir=CACHE_DIR, use_cache=True):
+    """Return the parsed ledger, re-parsing only rows appended since last run.
+
+    The snapshot covers every newline-terminated row of the file; a trailing
+    row without a newline is parsed fresh on each run so that a later append
+    completing it is never mistaken for a new row.
+    """
+    if not use_cache:
+        return read_csv(csv_path)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    state_path, snapshot_path = _cache_paths(csv_path, cache_dir)
+    state = _load_state(state_path, snapshot_path)
+    size = os.path.getsize(csv_path)
+
+    snapshot = None
+    if state is not None and state['offset'] <= size:
+        digest = _fingerprint(csv_path, state['offset'])
+        if digest.hexdigest() == state['fingerprint']:
+            snapshot = pd.read_pickle(snapshot_path)
+            if len(snapshot) != state['rows']:
+                snapshot = None
+
+    with open(csv_path, 'rb') as f:
+        if snapshot is None:
+            data = f.read()
+            header_end = data.find(b'\n') + 1
+            if header_end == 0:
+                return read_csv(csv_path)
+            columns = list(pd.read_csv(io.BytesIO(data[:header_end]), nrows=0).columns)
+            digest = hashlib.blake2b(data[:header_end], digest_size=20)
+            base, data = header_end, data[header_end:]
+            status = 'rebuilt'
+        else:
+            f.seek(state['offset'])
+            data = f.read()
+            columns = state['columns']
+            base = state['offset']
+            status = 'incremental'
+
+    # Keep category codes stable across appends and rebuilds alike.
+    categories = state['categories'] if state is not None else []
+
+    # Only newline-terminated rows go into the snapshot.
+    split = data.rfind(b'\n') + 1
+    appended = _parse(data[:split], columns, categories)
+    if appended is not None:
+        categories = list(appended['category'].cat.categories)
+    partial = _parse(data[split:], columns, categories)
+    complete = _concat(snapshot, appended)
+    if complete is None:
+        complete = _empty(columns, categories)
+
+    offset = base + split
+    if status == 'rebuilt' or offset != state['offset']:
+        # Extend the prefix hash with the new rows rather than re-reading it.
+        digest = digest.copy()
+        digest.update(data[:split])
+        new_state = {
+            'version': CACHE_VERSION,
+            'columns': columns,
+            'offset': offset,
+            'rows': len(complete),
+            'fingerprint': digest.hexdigest(),
+            'categories': list(complete['category'].cat.categories),
+        }
+        _save(state_path, snapshot_path, new_state, complete)
+
+    df = _concat(complete, partial)
+    df.attrs['ingest'] = {
+        'status': status,
+        'rows': len(df),
+        'parsed_rows': len(df) - (len(snapshot) if snapshot is not None else 0),
+    }
+    return df
@@ -0,0 +1,247 @@
+"""Append-only binary transaction store.
+
+An alternative to ``budget.csv`` that never needs parsing: transactions are
+fixed-width little-endian records ::
+
+    ts        int64   seconds since 1970-01-01 UTC
+    category  uint16  id into the category dictionary (then 6 padding bytes)
+    amount    int64   amount in qəpik
+
+behind a 32-byte header (magic, format version, record size and the number
+of committed records). Category names live in a JSON dictionary next to the
+store (``<store>.categories.json``); ids are positions in that list and are
+never reassigned, so new categories are only ever appended.
+
+Opening a store memory-maps the committed records read-only
+(:meth:`LedgerStore.records`): no bytes are read until they are used, so
+opening a 100M-row history costs the same as opening an empty one, and
+:meth:`LedgerStore.frame` hands the amount column to pandas without a copy.
+Records are padded to 24 bytes so every ``amount`` is 8-byte aligned; pandas
+copies a misaligned (packed) column.
+
+Appends are atomic. Records are written after the committed region and
+synced, the dictionary is replaced (``os.replace``) if it grew, and only then
+is the record count in the header updated with a single 8-byte write. A
+reader therefore sees either none or all of an append, and a crash mid-append
+leaves bytes past the count that the next append overwrites.
+
+Convert to and from the CSV layout with::
+
+    python ledger_store.py import budget.csv budget.bin
+    python ledger_store.py export budget.bin budget.csv
+    python ledger_store.py info budget.bin
+
+Timestamps are stored in UTC, so an exported CSV shows every time with a
+``+0000`` offset.
+"""
+import argparse
+import json
+import os
+import struct
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+
+import fx
+from ledger_cache import MINOR_UNITS, RAW_DTYPES, derive_columns, parse_frame
+
+MAGIC = b'BLEDGER\0'
+FORMAT_VERSION = 2  # 1 had packed 18-byte records
+RECORD = np.dtype([('ts', '<i8'), ('category', '<u2'), ('amount', '<i8')], align=True)
+# magic, version, record size, committed records, padding
+_HEADER = struct.Struct('<8sIIQ8x')
+HEADER_SIZE = _HEADER.size
+_COUNT_OFFSET = 16
+MAX_CATEGORIES = np.iinfo(np.uint16).max + 1
+CHUNKSIZE = 1_000_000
+CSV_DATE_FORMAT = '%Y-%m-%d %H:%M:%S +0000'
+
+
+def is_store(path):
+    """True if ``path`` is a binary ledger store (checked by its magic)."""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+class LedgerStore:
+    def __init__(self, path):
+        self.path = path
+        self.categories_path = os.path.splitext(path)[0] + '.categories.json'
+        with open(path, 'rb') as f:
+            magic, version, size, _ = _HEADER.unpack(f.read(HEADER_SIZE))
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a ledger store')
+        if version != FORMAT_VERSION or size != RECORD.itemsize:
+            raise ValueError(f'{path}: unsupported store format {version} '
+                             f'(record size {size}); export it with the version that '
+                             f'wrote it and import it again')
+
+    @classmethod
+    def create(cls, path, overwrite=False):
+        """Create an empty store (and its category dictionary)."""
+        if os.path.exists(path) and not overwrite:
+            raise FileExistsError(path)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, RECORD.itemsize, 0))
+        store_categories = os.path.splitext(path)[0] + '.categories.json'
+        _write_categories(store_categories, [])
+        os.replace(tmp, path)
+        return cls(path)
+
+    def __len__(self):
+        with open(self.path, 'rb') as f:
+            return _HEADER.unpack(f.read(HEADER_SIZE))[3]
+
+    @property
+    def categories(self):
+        with open(self.categories_path) as f:
+            return json.load(f)['categories']
+
+    def records(self, start=0, stop=None):
+        """Read-only memory map of the committed records ``[start, stop)``."""
+        n = len(self)
+        stop = n if stop is None else min(stop, n)
+        if stop <= start:
+            return np.zeros(0, dtype=RECORD)
+        return np.memmap(self.path, dtype=RECORD, mode='r',
+                         offset=HEADER_SIZE + start * RECORD.itemsize, shape=(stop - start,))
+
+    def frame(self, start=0, stop=None):
+        """Records as a typed ledger frame (see :mod:`ledger_cache`).
+
+        ``amount_minor`` is a view of the mapped records; the date and the
+        calendar columns are derived from ``ts``.
+        """
+        records = self.records(start, stop)
+        # Read after the count: every committed id is in the dictionary
+        categories = self.categories
+        df = pd.DataFrame({
+            'date': pd.to_datetime(records['ts'], unit='s', utc=True),
+            'category': pd.Categorical.from_codes(records['category'].astype(np.int32),
+                                                  categories=categories),
+            'amount_minor': records['amount'],
+        }, copy=False)
+        return derive_columns(df)
+
+    def frames(self, chunksize=CHUNKSIZE):
+        """Iterate over the store as typed frames of ``chunksize`` records."""
+        n = len(self)
+        for start in range(0, n, chunksize):
+            yield self.frame(start, start + chunksize)
+
+    def append(self, df):
+        """Atomically append a typed ledger frame; returns the new length."""
+        with open(self.path, 'r+b') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)  # serialize appenders
+            count = _HEADER.unpack(f.read(HEADER_SIZE))[3]
+
+            table = self.categories
+            names = df['category'].astype(str)
+            known = set(table)
+            added = sorted(set(names.unique()) - known)
+            if len(table) + len(added) > MAX_CATEGORIES:
+                raise ValueError(f'a store holds at most {MAX_CATEGORIES} categories')
+            table = table + added
+
+            date = df['date']
+            if date.dt.tz is not None:
+                date = date.dt.tz_convert('UTC').dt.tz_localize(None)
+            records = np.empty(len(df), dtype=RECORD)
+            records['ts'] = date.to_numpy(dtype='datetime64[s]').view(np.int64)
+            records['category'] = pd.Categorical(names, categories=table).codes
+            records['amount'] = df['amount_minor'].to_numpy()
+
+            # Data first, dictionary next, commit point (the count) last.
+            f.seek(HEADER_SIZE + count * RECORD.itemsize)
+            f.write(records.tobytes())
+            f.truncate()
+            f.flush()
+            os.fsync(f.fileno())
+            if added:
+                _write_categories(self.categories_path, table)
+            f.seek(_COUNT_OFFSET)
+            f.write(struct.pack('<Q', count + len(df)))
+            f.flush()
+            os.fsync(f.fileno())
+            return count + len(df)
+
+
+def _write_categories(path, categories):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'version': FORMAT_VERSION, 'categories': categories}, f, indent=2)
+    os.replace(tmp, path)
+
+
+def import_csv(csv_path, store_path, chunksize=CHUNKSIZE, overwrite=False, rates=None):
+    """Append every row of a ledger CSV to a (new) store.
+
+    Stores hold manat only: a ``currency`` column is converted on import
+    with ``rates`` (an :class:`fx.RateTable`).
+    """
+    store = LedgerStore.create(store_path, overwrite=overwrite)
+    for raw in pd.read_csv(csv_path, dtype=RAW_DTYPES, chunksize=chunksize):
+        store.append(fx.normalize(parse_frame(raw), rates))
+    return store
+
+
+def export_csv(store_path, csv_path, chunksize=CHUNKSIZE):
+    """Write a store back out in the ``date,category,amount`` CSV layout."""
+    store = LedgerStore(store_path)
+    categories = np.array(store.categories, dtype=object)
+    tmp = csv_path + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write('date,category,amount\n')
+        for start in range(0, len(store), chunksize):
+            records = store.records(start, start + chunksize)
+            pd.DataFrame({
+                'date': pd.to_datetime(records['ts'], unit='s').strftime(CSV_DATE_FORMAT),
+                'category': categories[records['category']],
+                'amount': records['amount'] / MINOR_UNITS,
+            }).to_csv(f, header=False, index=False, lineterminator='\n')
+    os.replace(tmp, csv_path)
+    return csv_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert between ledger CSVs and binary stores')
+    sub = parser.add_subparsers(dest='command', required=True)
+    imp = sub.add_parser('import', help='build a store from a ledger CSV')
+    imp.add_argument('csv')
+    imp.add_argument('store')
+    imp.add_argument('--force', action='store_true', help='overwrite an existing store')
+    imp.add_argument('--fx-rates', metavar='CSV',
+                     help='rate table for converting a currency column to manat')
+    exp = sub.add_parser('export', help='write a store out as a ledger CSV')
+    exp.add_argument('store')
+    exp.add_argument('csv')
+    info = sub.add_parser('info', help='print the size and categories of a store')
+    info.add_argument('store')
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        rates = fx.load_rates(args.fx_rates) if args.fx_rates else None
+        store = import_csv(args.csv, args.store, overwrite=args.force, rates=rates)
+        print(f'imported {len(store):,} transactions into {args.store}')
+    elif args.command == 'export':
+        export_csv(args.store, args.csv)
+        print(f'exported {len(LedgerStore(args.store)):,} transactions to {args.csv}')
+    else:
+        store = LedgerStore(args.store)
+        print(f'{args.store}: {len(store):,} transactions, '
+              f'{os.path.getsize(args.store):,} bytes')
+        print('categories:', ', '.join(store.categories))
+
+
+if __name__ == '__main__':
+    main()
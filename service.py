@@ -0,0 +1,353 @@
+"""Long-running local query service over the aggregated ledger.
+
+The ledger is loaded once and kept in memory in the typed schema together
+with its :class:`~aggregates.Aggregates` and :class:`~date_index.DateIndex`.
+Requests are answered from memory in the same JSON shape as ``insights.json``::
+
+    python service.py --port 8765            # or --socket /tmp/expenses.sock
+
+    GET /insights                            full insights dict
+    GET /summary?start=2024-01-01&end=2024-06-30
+    GET /categories?weekday=Saturday&weekday=Sunday
+    GET /percentiles?category=Coffe,Market
+    GET /totals?start=2024-03-01&end=2024-03-31&category=Taxi
+    GET /score?date=2025-12-01T12:30Z&category=Coffe&amount=45
+    GET /health
+
+Every insights section (``summary``, ``categories``, ``monthly``, ...) is an
+endpoint, and all of them accept ``start``/``end`` (inclusive UTC dates),
+``category`` and ``weekday`` (name or 0 = Monday) filters; repeat a parameter
+or separate values with commas. ``/totals`` answers total, count and mean for
+a date range straight from the prefix-sum index, and ``/score`` rates one
+incoming transaction against the anomaly baselines (see :mod:`anomalies`).
+
+Results are kept in a bounded LRU cache. Before answering, the service stats
+the ledger; when it has grown, only the appended rows are parsed (through the
+ingestion cache), aggregated, indexed and scored, and merged into what is held
+in memory; an edit to existing rows or a new rate table rebuilds everything.
+Either way the result cache is cleared. Filters are applied to the in-memory
+cube, so a filtered query never regroups the transactions; only its order
+statistics (percentiles, largest transactions) are taken from the matching
+rows.
+"""
+import argparse
+import json
+import os
+import socketserver
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+import aggregates
+import anomalies
+from aggregates import DAY_ORDER
+from analyze_expenses import build_insights, load
+from date_index import DateIndex
+from ledger_cache import CACHE_DIR
+
+CACHE_SIZE = 256
+FILTERS = ('start', 'end', 'category', 'weekday')
+# Endpoints answered by query(): the insights sections plus the whole dict
+# and the prefix-sum totals.
+SECTIONS = frozenset({
+    'insights', 'totals', 'summary', 'categories', 'monthly', 'yearly', 'quarterly',
+    'daily_patterns', 'transaction_analysis', 'percentiles', 'savings_potential', 'anomalies',
+})
+
+
+class QueryError(ValueError):
+    """A request the service cannot answer; reported as HTTP 400."""
+
+
+def _values(params, name):
+    return [v.strip() for value in params.get(name, []) for v in value.split(',') if v.strip()]
+
+
+def _day(text):
+    try:
+        stamp = pd.Timestamp(text)
+    except ValueError:
+        raise QueryError(f'invalid date: {text!r}') from None
+    if stamp.tz is not None:
+        stamp = stamp.tz_convert('UTC').tz_localize(None)
+    return int(np.datetime64(stamp, 'D').astype(np.int64))
+
+
+def _weekday(text):
+    if text.isdigit() and int(text) < 7:
+        return int(text)
+    names = [day.lower() for day in DAY_ORDER]
+    for i, name in enumerate(names):
+        if text.lower() in (name, name[:3]):
+            return i
+    raise QueryError(f'invalid weekday: {text!r}')
+
+
+def _json_safe(value):
+    """``value`` with NaN and infinities replaced by None (JSON null)."""
+    if isinstance(value, float):
+        return value if np.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: _json_safe(v) for key, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(v) for v in value]
+    return value
+
+
+def _mask(days, category, query):
+    """Rows matching the filters, given their day numbers and categories."""
+    start, end, categories, weekdays = query
+    mask = np.ones(len(days), dtype=bool)
+    if start is not None:
+        mask &= days >= start
+    if end is not None:
+        mask &= days <= end
+    if categories:
+        mask &= category.isin(categories).to_numpy()
+    if weekdays:
+        mask &= np.isin((days + 3) % 7, weekdays)  # 1970-01-01 was a Thursday
+    return mask
+
+
+def _extends(old, new):
+    """True if ``new`` is ``old`` with rows appended (codes unchanged)."""
+    if len(new) < len(old):
+        return False
+    table = list(old['category'].cat.categories)
+    if list(new['category'].cat.categories[:len(table)]) != table:
+        return False
+    head = new.iloc[:len(old)]
+    return (np.array_equal(head['date'].values, old['date'].values)
+            and np.array_equal(head['category'].cat.codes.to_numpy(),
+                               old['category'].cat.codes.to_numpy())
+            and np.array_equal(head['amount_minor'].to_numpy(), old['amount_minor'].to_numpy()))
+
+
+def normalize(params):
+    """Canonical, hashable form of the filter parameters of a request."""
+    unknown = set(params) - set(FILTERS)
+    if unknown:
+        raise QueryError(f"unknown parameter(s): {', '.join(sorted(unknown))}")
+    start = _values(params, 'start')
+    end = _values(params, 'end')
+    return (
+        _day(start[-1]) if start else None,
+        _day(end[-1]) if end else None,
+        tuple(sorted(set(_values(params, 'category')))),
+        tuple(sorted({_weekday(v) for v in _values(params, 'weekday')})),
+    )
+
+
+class LedgerService:
+    """In-memory ledger, aggregates and an LRU cache of query results."""
+
+    def __init__(self, csv_path='budget.csv', cache_dir=CACHE_DIR, cache_size=CACHE_SIZE,
+                 fx_rates=None):
+        self.csv_path = csv_path
+        self.fx_rates = fx_rates
+        self.cache_dir = cache_dir
+        self.cache_size = cache_size
+        self.results = OrderedDict()
+        self.hits = self.misses = 0
+        self.refreshes = 0
+        self.df = None
+        self._stat = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Reload the ledger if it (or the FX rate table) changed on disk.
+
+        Returns True if it did.
+        """
+        paths = [self.csv_path] + ([self.fx_rates] if self.fx_rates else [])
+        key = [(stat.st_size, stat.st_mtime_ns) for stat in map(os.stat, paths)]
+        if key == self._stat:
+            return False
+        # The ingestion cache parses only the rows appended since last time
+        # and rebuilds from scratch if anything before them was edited; a
+        # binary store is simply mapped again.
+        df = load(self.csv_path, cache_dir=self.cache_dir, fx_rates=self.fx_rates)
+        if self.df is not None and _extends(self.df, df):
+            appended = df.iloc[len(self.df):]
+            if len(appended):
+                agg = aggregates.build(appended)
+                self.agg = self.agg.merge(agg, df['amount_minor'])
+                self.index = self.index.merge(DateIndex.from_aggregates(agg))
+                self.scores = pd.concat([self.scores,
+                                         anomalies.observe_frame(self.detector, appended)])
+        else:
+            self.agg = aggregates.build(df)
+            self.index = DateIndex.from_aggregates(self.agg)
+            self.scores, self.detector = anomalies.backfill(df)
+        self.df = df
+        self._cube_days = self.agg.cube['day'].values.astype('datetime64[D]').astype(np.int64)
+        self.results.clear()
+        self._stat = key
+        self.refreshes += 1
+        return True
+
+    def _filtered(self, query):
+        start, end, categories, weekdays = query
+        if start is None and end is None and not categories and not weekdays:
+            return self.agg, self.scores
+        cube_mask = _mask(self._cube_days, self.agg.cube['category'], query)
+        if not cube_mask.any():
+            return None, None
+        df = self.df
+        mask = _mask(df['day'].to_numpy().astype(np.int64), df['category'], query)
+        return self.agg.restrict(cube_mask, df[mask]), self.scores.loc[df.index[mask]]
+
+    def _compute(self, section, query):
+        if section not in SECTIONS:
+            raise LookupError(f'unknown endpoint: /{section}')
+        if section == 'totals':
+            start, end, categories, weekdays = query
+            if weekdays:
+                raise QueryError('/totals does not support the weekday filter')
+            unknown = sorted(set(categories or ()) - set(self.index.categories))
+            if unknown:
+                raise LookupError(f"unknown category: {', '.join(unknown)}")
+            result = self.index.query(None if start is None else np.datetime64(start, 'D'),
+                                      None if end is None else np.datetime64(end, 'D'),
+                                      categories or None)
+            return {k: (None if np.isnan(v) else v) for k, v in result.items()}
+
+        agg, scores = self._filtered(query)
+        if agg is None:
+            raise LookupError('no transactions match the filters')
+        insights = build_insights(agg, scores)
+        return insights if section == 'insights' else insights[section]
+
+    def query(self, section, params):
+        """Return the JSON-serializable answer for ``/section?params``."""
+        with self._lock:
+            self.refresh()
+            key = (section, normalize(params))
+            if key in self.results:
+                self.hits += 1
+                self.results.move_to_end(key)
+                return self.results[key]
+            self.misses += 1
+            result = self._compute(*key)
+            self.results[key] = result
+            if len(self.results) > self.cache_size:
+                self.results.popitem(last=False)
+            return result
+
+    def score(self, params):
+        """Anomaly scores of one transaction given as ``date``, ``category``
+        and ``amount`` parameters; the transaction is not added."""
+        values = {name: _values(params, name) for name in ('date', 'category', 'amount')}
+        missing = [name for name, value in values.items() if not value]
+        if missing:
+            raise QueryError(f"missing parameter(s): {', '.join(missing)}")
+        try:
+            when = pd.Timestamp(values['date'][-1])
+            amount = float(values['amount'][-1])
+        except ValueError as exc:
+            raise QueryError(str(exc)) from None
+        with self._lock:
+            self.refresh()
+            result = self.detector.score(when, values['category'][-1], amount)
+        return {key: bool(v) if key == 'flagged' else float(v) for key, v in result.items()}
+
+    def health(self):
+        with self._lock:
+            self.refresh()
+            return {
+                'ledger': self.csv_path,
+                'transactions': self.agg.count,
+                'refreshes': self.refreshes,
+                'ingest': self.df.attrs.get('ingest'),
+                'cache': {'size': len(self.results), 'max_size': self.cache_size,
+                          'hits': self.hits, 'misses': self.misses},
+            }
+
+
+class Handler(BaseHTTPRequestHandler):
+    service = None  # set by make_server
+    quiet = False
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        section = url.path.strip('/') or 'insights'
+        try:
+            if section == 'health':
+                body = self.service.health()
+            elif section == 'score':
+                body = self.service.score(parse_qs(url.query))
+            else:
+                body = self.service.query(section, parse_qs(url.query))
+            status = 200
+        except QueryError as exc:
+            status, body = 400, {'error': str(exc)}
+        except LookupError as exc:
+            status, body = 404, {'error': str(exc)}
+        except Exception as exc:  # e.g. a malformed row appended to the ledger
+            self.log_error('%s', exc)
+            status, body = 500, {'error': f'{type(exc).__name__}: {exc}'}
+        payload = json.dumps(_json_safe(body), default=str, allow_nan=False).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def address_string(self):
+        # Unix-socket clients have no (host, port) address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(service, host='127.0.0.1', port=8765, socket_path=None, quiet=False):
+    handler = type('LedgerHandler', (Handler,), {'service': service, 'quiet': quiet})
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        return UnixHTTPServer(socket_path, handler)
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve expense insights from memory')
+    parser.add_argument('csv', nargs='?', default='budget.csv',
+                        help='ledger CSV or binary store to serve (default: %(default)s)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--socket', metavar='PATH',
+                        help='listen on a Unix socket instead of TCP')
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE,
+                        help='number of query results kept in memory (default: %(default)s)')
+    parser.add_argument('--fx-rates', metavar='CSV',
+                        help='rate table for a ledger with a currency column')
+    parser.add_argument('-q', '--quiet', action='store_true', help='do not log requests')
+    args = parser.parse_args()
+
+    service = LedgerService(args.csv, cache_size=args.cache_size, fx_rates=args.fx_rates)
+    service.refresh()
+    server = make_server(service, args.host, args.port, args.socket, args.quiet)
+    where = args.socket or f'http://{args.host}:{args.port}'
+    print(f'Serving {service.agg.count:,} transactions from {args.csv} on {where}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+if __name__ == '__main__':
+    main()